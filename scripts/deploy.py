@@ -6,20 +6,28 @@ Includes automatic DNS management via Namecheap API.
 """
 
 import argparse
+import asyncio
 import json
 import os
+import queue
 import shutil
 import subprocess
 import sys
 import threading
 import time
 import traceback
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import List, Dict, Any, Tuple, Optional
+from typing import List, Dict, Any, Set, Tuple, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
 
 # Import shared utilities
-from .utils import load_project_env, check_fly_auth, run_command as shared_run_command
+from .utils import (
+    PROJECT_ROOT, CERT_POLL_INITIAL_INTERVAL, CERT_POLL_MAX_INTERVAL, CERT_POLL_BACKOFF,
+    load_project_env, check_fly_auth, get_fly_api_token
+)
 # Import DNS management functions
 from .namecheap_dns import (
     get_dns_proxy_config, 
@@ -30,34 +38,129 @@ from .namecheap_dns import (
 load_project_env()
 
 
-# Thread lock for safe printing during parallel operations
-_print_lock = threading.Lock()
+FLY_GRAPHQL_URL = "https://api.fly.io/graphql"
 
-def run_command(cmd: List[str], check: bool = True, silent: bool = False, input: str = None) -> subprocess.CompletedProcess:
-    """Run a command and return the result. Wrapper for shared run_command with thread safety."""
-    if not silent:
-        with _print_lock:
-            print(f"🔧 Running: {' '.join(cmd)}")
+# flyctl error messages meaning `apps create` failed only because the name is taken
+APP_EXISTS_ERROR_PATTERNS = ('already exists', 'already been taken')
+
+# Shared session so Fly.io API queries reuse pooled keep-alive connections
+# instead of paying a flyctl process start and TLS handshake per lookup
+_fly_session = requests.Session()
+_fly_session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=16))
+
+FLY_APPS_QUERY = """
+query($after: String) {
+  apps(first: 100, after: $after) {
+    nodes { name }
+    pageInfo { hasNextPage endCursor }
+  }
+}
+"""
+
+FLY_CERTIFICATES_QUERY = """
+query($appName: String!) {
+  app(name: $appName) {
+    certificates { nodes { hostname } }
+  }
+}
+"""
+
+FLY_CERTIFICATE_STATUS_QUERY = """
+query($appName: String!) {
+  app(name: $appName) {
+    certificates {
+      nodes { hostname configured certificateAuthority clientStatus issued { nodes { type } } }
+    }
+  }
+}
+"""
+
+
+# Log lines from concurrent deployments are queued and written by a single
+# writer thread, so coroutines never block the event loop on stdout
+_log_q: "queue.Queue[str]" = queue.Queue()
+
+
+def _log_writer() -> None:
+    """Drain queued log lines to stdout."""
+    while True:
+        line = _log_q.get()
+        print(line)
+        _log_q.task_done()
+
+
+threading.Thread(target=_log_writer, name="deploy-log", daemon=True).start()
+
+
+def _log(message: str) -> None:
+    """Queue a log line for the writer thread."""
+    _log_q.put_nowait(message)
+
+
+async def run_command(cmd: List[str], check: bool = True, silent: bool = False, input: str = None,
+                      cwd: Optional[Path] = None, capture: bool = True) -> subprocess.CompletedProcess:
+    """Run a command without blocking the event loop and return the result.
     
-    # Use shared run_command but handle input parameter compatibility
-    result = shared_run_command(cmd, check=check, silent=True, input_data=input)
+    With capture=False stdout is discarded instead of piped (result.stdout is None);
+    stderr is always captured for error messages.
+    """
+    if not silent:
+        _log(f"🔧 Running: {' '.join(cmd)}")
+    
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdin=asyncio.subprocess.PIPE if input is not None else None,
+        stdout=asyncio.subprocess.PIPE if capture else asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE,
+        cwd=cwd
+    )
+    stdout, stderr = await proc.communicate(input.encode() if input is not None else None)
+    result = subprocess.CompletedProcess(
+        cmd, proc.returncode, stdout.decode() if stdout is not None else None, stderr.decode()
+    )
     
     if result.stdout and not silent:
-        with _print_lock:
-            print(result.stdout.strip())
+        _log(result.stdout.strip())
     
-    # Handle CalledProcessError compatibility
-    if hasattr(result, 'returncode') and result.returncode != 0 and check:
+    if result.returncode != 0 and check:
         if not silent:
-            with _print_lock:
-                print(f"❌ Command failed: returncode {result.returncode}")
-                if result.stderr:
-                    print(f"Error: {result.stderr.strip()}")
+            _log(f"❌ Command failed: returncode {result.returncode}")
+            if result.stderr:
+                _log(f"Error: {result.stderr.strip()}")
+        _log_q.join()
         sys.exit(1)
     
     return result
 
 
+@dataclass(slots=True)
+class ServiceInfo:
+    """A deployable service and the paths and names derived from it."""
+    name: str
+    path: Path
+    type: str
+    config: Dict[str, Any]
+    app_name: str = field(init=False)
+    fly_toml_path: Path = field(init=False)
+    domain: str = field(init=False)
+    
+    def __post_init__(self) -> None:
+        self.app_name = f"shmuel-tech-{self.name}"
+        # Absolute, so flyctl finds it regardless of the working directory it runs in
+        self.fly_toml_path = (self.path / 'fly.toml').resolve()
+        self.domain = "shmuel.tech" if self.name == "main-site" else f"{self.name}.shmuel.tech"
+    
+    @classmethod
+    def from_dir(cls, service_dir: Path) -> "ServiceInfo":
+        """Build service info from a service directory and its .shmuel-tech.json config."""
+        config = get_service_config(service_dir)
+        return cls(
+            name=service_dir.name,
+            path=service_dir,
+            type=config.get('service_type', 'go'),
+            config=config
+        )
+
 
 def get_service_config(service_dir: Path) -> Dict[str, Any]:
     """Get service configuration from .shmuel-tech.json file."""
@@ -73,24 +176,21 @@ def get_service_config(service_dir: Path) -> Dict[str, Any]:
         raise ValueError(f"Could not read config file {config_file}: {e}")
 
 
-def get_services(services_dir: Path) -> List[Dict[str, Any]]:
+def get_services(services_dir: Path) -> List[ServiceInfo]:
     """Get list of services with their types."""
     services = []
     
-    for service_dir in services_dir.iterdir():
-        if service_dir.is_dir() and not service_dir.name.startswith('.'):
-            try:
-                config = get_service_config(service_dir)
-                service_info = {
-                    'name': service_dir.name,
-                    'path': service_dir,
-                    'type': config.get('service_type', 'go'),
-                    'config': config
-                }
-                services.append(service_info)
-            except (FileNotFoundError, ValueError) as e:
-                print(f"❌ Error: Service '{service_dir.name}' is missing or has invalid .shmuel-tech.json config file: {e}")
-                sys.exit(1)
+    # os.scandir reuses the file type from the directory listing, avoiding a stat() per entry
+    with os.scandir(services_dir) as entries:
+        service_dirs = [Path(entry.path) for entry in entries
+                        if not entry.name.startswith('.') and entry.is_dir()]
+    
+    for service_dir in service_dirs:
+        try:
+            services.append(ServiceInfo.from_dir(service_dir))
+        except (FileNotFoundError, ValueError) as e:
+            print(f"❌ Error: Service '{service_dir.name}' is missing or has invalid .shmuel-tech.json config file: {e}")
+            sys.exit(1)
     
     return services
 
@@ -98,66 +198,149 @@ def get_services(services_dir: Path) -> List[Dict[str, Any]]:
 # check_fly_auth function moved to shared utils
 
 
-def app_exists(app_name: str, silent: bool = False) -> bool:
-    """Check if a Fly.io app exists."""
+def fly_graphql(query: str, variables: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Run a query against the Fly.io GraphQL API and return its data. Raises on any failure."""
+    token = get_fly_api_token()
+    if not token:
+        raise ValueError("No Fly.io API token available")
+    
+    # Macaroon tokens carry their own "FlyV1" scheme, legacy tokens use Bearer
+    authorization = token if token.startswith('FlyV1 ') else f"Bearer {token}"
+    response = _fly_session.post(
+        FLY_GRAPHQL_URL,
+        json={'query': query, 'variables': variables or {}},
+        headers={'Authorization': authorization},
+        timeout=30
+    )
+    response.raise_for_status()
+    
+    result = response.json()
+    if result.get('errors'):
+        raise Exception(f"Fly.io API error: {result['errors'][0].get('message', 'Unknown error')}")
+    return result['data']
+
+
+def _list_apps_via_api() -> Set[str]:
+    """List all app names through the Fly.io GraphQL API, following pagination."""
+    names = set()
+    cursor = None
+    while True:
+        apps = fly_graphql(FLY_APPS_QUERY, {'after': cursor})['apps']
+        names.update(node['name'] for node in apps['nodes'])
+        if not apps['pageInfo']['hasNextPage']:
+            return names
+        cursor = apps['pageInfo']['endCursor']
+
+
+def _list_certificates_via_api(app_name: str) -> Set[str]:
+    """List certificate hostnames for an app through the Fly.io GraphQL API."""
+    app = fly_graphql(FLY_CERTIFICATES_QUERY, {'appName': app_name})['app']
+    return {node['hostname'] for node in app['certificates']['nodes']}
+
+
+def _certificate_statuses_via_api(app_name: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Get the status of every certificate of an app with one Fly.io API query,
+    keyed by hostname and shaped like `flyctl certs show --json` output.
+    """
+    app = fly_graphql(FLY_CERTIFICATE_STATUS_QUERY, {'appName': app_name})['app']
+    return {
+        node['hostname']: {
+            'Configured': node['configured'],
+            'CertificateAuthority': node['certificateAuthority'],
+            'ClientStatus': node['clientStatus'],
+            'Issued': {'Nodes': node['issued']['nodes']},
+        }
+        for node in app['certificates']['nodes']
+    }
+
+
+async def get_existing_apps(silent: bool = True) -> Optional[Set[str]]:
+    """
+    Get the names of all Fly.io apps with a single API query, falling back to `flyctl apps list`.
+    Returns None if the apps can't be listed, so callers don't mistake every app for a new one.
+    """
     if not silent:
-        print(f"📱 Checking if app '{app_name}' exists...")
-    result = run_command(['flyctl', 'apps', 'list'], check=False, silent=silent)
-    if result.returncode == 0:
-        return app_name in result.stdout
-    return False
+        _log("📱 Listing existing Fly.io apps...")
+    try:
+        return await asyncio.to_thread(_list_apps_via_api)
+    except Exception as e:
+        if not silent:
+            _log(f"⚠️  Fly.io API query failed ({e}), falling back to flyctl")
+    
+    result = await run_command(['flyctl', 'apps', 'list', '--json'], check=False, silent=silent)
+    if result.returncode != 0:
+        return None
+    try:
+        return {app['Name'] for app in json.loads(result.stdout)}
+    except (json.JSONDecodeError, KeyError, TypeError):
+        return None
 
 
-def cert_exists(app_name: str, domain: str, silent: bool = False) -> bool:
-    """Check if SSL certificate exists for domain."""
+async def get_app_certificates(app_name: str, silent: bool = True) -> Set[str]:
+    """Get the hostnames of all SSL certificates for an app with a single API query, falling back to `flyctl certs list`."""
     if not silent:
-        print(f"🔒 Checking SSL certificate for '{domain}' in app '{app_name}'...")
-    result = run_command(['flyctl', 'certs', 'list', '--app', app_name], check=False, silent=silent)
-    if result.returncode == 0:
-        return domain in result.stdout
-    return False
+        _log(f"🔒 Listing SSL certificates for app '{app_name}'...")
+    try:
+        return await asyncio.to_thread(_list_certificates_via_api, app_name)
+    except Exception as e:
+        if not silent:
+            _log(f"⚠️  Fly.io API query failed ({e}), falling back to flyctl")
+    
+    result = await run_command(['flyctl', 'certs', 'list', '--app', app_name, '--json'], check=False, silent=silent)
+    if result.returncode != 0:
+        return set()
+    try:
+        return {cert['Hostname'] for cert in json.loads(result.stdout)}
+    except (json.JSONDecodeError, KeyError, TypeError):
+        return set()
 
 
-def create_app(app_name: str, org: str = "personal", silent: bool = False) -> Tuple[bool, Optional[str]]:
-    """Create a new Fly.io app. Returns (success, error_message)."""
+async def create_app(app_name: str, org: str = "personal", silent: bool = False,
+                     accept_existing: bool = False) -> Tuple[bool, Optional[str]]:
+    """
+    Create a new Fly.io app. Returns (success, error_message).
+    With accept_existing, an "already exists" error counts as success; only use it
+    when we could not check whether the app is ours, since Fly also reports a name
+    taken by another org or user that way.
+    """
     if not silent:
-        print(f"📱 Creating new Fly.io app: {app_name}")
-    result = run_command(['flyctl', 'apps', 'create', app_name, '--org', org], check=False, silent=silent)
+        _log(f"📱 Creating new Fly.io app: {app_name}")
+    result = await run_command(['flyctl', 'apps', 'create', app_name, '--org', org], check=False, silent=silent, capture=not silent)
     if result.returncode == 0:
         return True, None
+    elif accept_existing and result.stderr and any(pattern in result.stderr.lower() for pattern in APP_EXISTS_ERROR_PATTERNS):
+        # The app is already there, which is all we need
+        return True, None
     else:
         return False, f"Exit code {result.returncode}: {result.stderr.strip() if result.stderr else 'Unknown error'}"
 
 
-def add_certificate(app_name: str, domains: List[str], silent: bool = False) -> Tuple[bool, Optional[str]]:
+async def add_certificate(app_name: str, domains: List[str], silent: bool = False) -> Tuple[bool, Optional[str]]:
     """Add SSL certificates for specified domains. Returns (success, error_message)."""
     if not silent:
-        print(f"🔒 Adding SSL certificates for {domains} to app '{app_name}'...")
+        _log(f"🔒 Adding SSL certificates for {domains} to app '{app_name}'...")
     
-    # Add and wait for each certificate
+    # Submit every certificate first (in order), so their issuance proceeds in parallel
     for domain in domains:
-        # Add certificate
-        result = run_command(['flyctl', 'certs', 'add', domain, '--app', app_name], check=False, silent=silent)
+        result = await run_command(['flyctl', 'certs', 'add', domain, '--app', app_name], check=False, silent=silent, capture=not silent)
         if result.returncode != 0:
             return False, f"Exit code {result.returncode}: {result.stderr.strip() if result.stderr else 'Unknown error'}"
-        
-        # Wait for certificate to be issued
-        if not silent:
-            print(f"⏳ Waiting for certificate '{domain}' to be issued...")
-        
-        success, error_msg = wait_for_certificate_issuance(app_name, domain, silent=silent)
-        if not success:
-            return False, f"Failed to wait for certificate '{domain}': {error_msg}"
-        
-        if not silent:
-            print(f"✅ Certificate for '{domain}' has been issued")
+    
+    # Then wait for all of them together
+    if not silent:
+        _log(f"⏳ Waiting for certificates {domains} to be issued...")
+    
+    success, error_msg = await wait_for_certificates_issuance(app_name, domains, silent=silent)
+    if not success:
+        return False, f"Failed to wait for certificates {domains}: {error_msg}"
     
     return True, None
 
 
-def clone_remote_repository(service: Dict[str, Any], silent: bool = False) -> Tuple[bool, Optional[str], Optional[Path]]:
+async def clone_remote_repository(service: ServiceInfo, silent: bool = False) -> Tuple[bool, Optional[str], Optional[Path]]:
     """Clone remote repository for deployment. Returns (success, error_message, build_path)."""
-    config = service['config']
+    config = service.config
     repo_url = config.get('remote_repo_url')
     git_ref = config.get('git_ref', 'master')
     
@@ -165,262 +348,329 @@ def clone_remote_repository(service: Dict[str, Any], silent: bool = False) -> Tu
         return False, "remote_repo_url not configured in .shmuel-tech.json", None
     
     # Create build directory in the service directory
-    build_dir = service['path'] / 'build_dir'
+    build_dir = service.path / 'build_dir'
     
     if not silent:
-        print(f"🌀 Preparing remote repository: {repo_url} at ref: {git_ref}")
+        _log(f"🌀 Preparing remote repository: {repo_url} at ref: {git_ref}")
     
     try:
         # Check if build directory already exists
         if build_dir.exists():
             if not silent:
-                print(f"📋 Updating existing repository at ref: {git_ref}")
+                _log(f"📋 Updating existing repository at ref: {git_ref}")
+            
+            # Run git operations inside the build directory (passed per command,
+            # since the process-wide working directory is shared by all coroutines)
+            # Fetch latest changes
+            result = await run_command(['git', 'fetch', 'origin'], check=False, silent=silent, cwd=build_dir, capture=not silent)
+            if result.returncode != 0:
+                return False, f"Git fetch failed: {result.stderr}", None
+            
+            # Checkout the specific git reference
+            result = await run_command(['git', 'checkout', git_ref], check=False, silent=silent, cwd=build_dir, capture=not silent)
+            if result.returncode != 0:
+                return False, f"Git checkout failed for ref '{git_ref}': {result.stderr}", None
+            
+            # Try to pull if it's a branch (will fail silently for commit hashes/tags)
+            result = await run_command(['git', 'pull'], check=False, silent=True, cwd=build_dir, capture=False)
+            if result.returncode != 0 and not silent:
+                _log(f"📋 Using specific ref (tag/commit): {git_ref}")
             
-            # Change to build directory for git operations
-            original_cwd = os.getcwd()
-            try:
-                os.chdir(build_dir)
-                
-                # Fetch latest changes
-                result = run_command(['git', 'fetch', 'origin'], check=False, silent=silent)
-                if result.returncode != 0:
-                    return False, f"Git fetch failed: {result.stderr}", None
-                
-                # Checkout the specific git reference
-                result = run_command(['git', 'checkout', git_ref], check=False, silent=silent)
-                if result.returncode != 0:
-                    return False, f"Git checkout failed for ref '{git_ref}': {result.stderr}", None
-                
-                # Try to pull if it's a branch (will fail silently for commit hashes/tags)
-                result = run_command(['git', 'pull'], check=False, silent=True)
-                if result.returncode != 0 and not silent:
-                    print(f"📋 Using specific ref (tag/commit): {git_ref}")
-                
-            finally:
-                os.chdir(original_cwd)
-                
             if not silent:
-                print(f"✅ Repository updated at ref: {git_ref}")
+                _log(f"✅ Repository updated at ref: {git_ref}")
         else:
             # Clone fresh repository
             if not silent:
-                print(f"📋 Cloning {repo_url} at ref: {git_ref}")
+                _log(f"📋 Cloning {repo_url} at ref: {git_ref}")
             
             # Clone the repository
-            result = run_command(['git', 'clone', repo_url, str(build_dir)], check=False, silent=silent)
+            result = await run_command(['git', 'clone', repo_url, str(build_dir)], check=False, silent=silent, capture=not silent)
             if result.returncode != 0:
                 return False, f"Git clone failed: {result.stderr}", None
             
             # Checkout the specific git reference
-            original_cwd = os.getcwd()
-            try:
-                os.chdir(build_dir)
-                result = run_command(['git', 'checkout', git_ref], check=False, silent=silent)
-            finally:
-                os.chdir(original_cwd)
-                
+            result = await run_command(['git', 'checkout', git_ref], check=False, silent=silent, cwd=build_dir, capture=not silent)
             if result.returncode != 0:
                 return False, f"Git checkout failed for ref '{git_ref}': {result.stderr}", None
             
             if not silent:
-                print(f"✅ Repository cloned at ref: {git_ref}")
+                _log(f"✅ Repository cloned at ref: {git_ref}")
         
         return True, None, build_dir
     except Exception as e:
         return False, f"Exception during git operations: {str(e)}", None
 
 
-def wait_for_certificate_issuance(app_name: str, domain: str, silent: bool = False, timeout: int = 600) -> Tuple[bool, Optional[str]]:
-    """Wait for certificate to be issued. Returns (success, error_message)."""
+def _certificate_issued(cert_data: Dict[str, Any]) -> bool:
+    """Check whether a parsed `flyctl certs show --json` payload describes an issued certificate."""
+    # Check if certificate is issued by looking for Issued.Nodes
+    if 'Issued' in cert_data and 'Nodes' in cert_data['Issued'] and cert_data['Issued']['Nodes']:
+        return True
+    
+    # Also check if the certificate is configured and ready
+    return bool(cert_data.get('Configured', False) and cert_data.get('CertificateAuthority', ''))
+
+
+async def _poll_cert_json(app_name: str, domain: str) -> Tuple[int, bytes, bytes]:
+    """
+    Run `flyctl certs show --json` for the polling loop, skipping run_command's
+    decoding and logging; json.loads parses the raw stdout bytes directly.
+    Returns (returncode, stdout, stderr).
+    """
+    proc = await asyncio.create_subprocess_exec(
+        'flyctl', 'certs', 'show', domain, '--app', app_name, '--json',
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    stdout, stderr = await proc.communicate()
+    return proc.returncode, stdout, stderr
+
+
+# Set once the certificate status API query has failed, so later polling rounds
+# go straight to flyctl instead of waiting out the API request again each time
+_cert_status_api_failed = False
+
+
+async def get_certificate_statuses(app_name: str, domains: List[str],
+                                   silent: bool = False) -> Tuple[Dict[str, Optional[Dict[str, Any]]], Optional[str]]:
+    """
+    Fetch the status of several certificates in one polling round: a single API
+    query for the whole app when possible, otherwise one `flyctl certs show` per domain.
+    Returns (domain -> status payload, or None if it could not be parsed; error_message).
+    """
+    global _cert_status_api_failed
+    if not _cert_status_api_failed:
+        try:
+            statuses = await asyncio.to_thread(_certificate_statuses_via_api, app_name)
+            # A domain missing from the listing has not been registered yet
+            return {domain: statuses.get(domain, {}) for domain in domains}, None
+        except Exception as e:
+            _cert_status_api_failed = True
+            if not silent:
+                _log(f"⚠️  Fly.io API query failed ({e}), using flyctl for certificate status from now on")
+    
+    results = await asyncio.gather(*(_poll_cert_json(app_name, domain) for domain in domains))
+    
+    statuses = {}
+    for domain, (returncode, stdout, stderr) in zip(domains, results):
+        if returncode != 0:
+            return {}, f"Certificate check failed for '{domain}': {stderr.decode(errors='replace')}"
+        try:
+            statuses[domain] = json.loads(stdout)
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            if not silent:
+                _log(f"⚠️  Failed to parse certificate status for '{domain}': {str(e)}")
+                _log(f"Raw output: {stdout.decode(errors='replace')}")
+            statuses[domain] = None
+    
+    return statuses, None
+
+
+async def wait_for_certificates_issuance(app_name: str, domains: List[str], silent: bool = False,
+                                         timeout: int = 600) -> Tuple[bool, Optional[str]]:
+    """
+    Wait for several certificates to be issued, checking all pending domains
+    in one polling round per cycle with a shared exponential backoff.
+    Returns (success, error_message).
+    """
     start_time = time.time()
+    interval = CERT_POLL_INITIAL_INTERVAL
+    pending = list(domains)
     
     while time.time() - start_time < timeout:
-        # Check certificate status
-        result = run_command(['flyctl', 'certs', 'show', domain, '--app', app_name, '--json'], check=False, silent=True)
+        # Check status of every outstanding certificate at once
+        statuses, error_msg = await get_certificate_statuses(app_name, pending, silent=silent)
+        if error_msg:
+            return False, error_msg
         
-        if result.returncode != 0:
-            return False, f"Certificate check failed: {result.stderr}"
-        
-        try:
-            cert_data = json.loads(result.stdout)
-            
-            # Check if certificate is issued by looking for Issued.Nodes
-            if 'Issued' in cert_data and 'Nodes' in cert_data['Issued'] and cert_data['Issued']['Nodes']:
-                # Certificate is issued
-                return True, None
+        still_pending = []
+        for domain in pending:
+            cert_data = statuses[domain]
+            if cert_data is None:
+                # Start over from the short interval after a garbled response
+                interval = CERT_POLL_INITIAL_INTERVAL
+                still_pending.append(domain)
+                continue
             
-            # Also check if the certificate is configured and ready
-            if cert_data.get('Configured', False) and cert_data.get('CertificateAuthority', ''):
-                # Certificate is configured and ready
-                return True, None
+            if _certificate_issued(cert_data):
+                if not silent:
+                    _log(f"✅ Certificate for '{domain}' has been issued")
+                continue
             
             # Check ClientStatus for additional information
-            client_status = cert_data.get('ClientStatus', '')
             if not silent:
-                print(f"📋 Certificate '{domain}' status: {client_status}")
-            
-            # Wait before checking again
-            time.sleep(1)
-            
-        except json.JSONDecodeError as e:
-            if not silent:
-                print(f"⚠️  Failed to parse certificate status for '{domain}': {str(e)}")
-                print(f"Raw output: {result.stdout}")
-            time.sleep(1)
+                _log(f"📋 Certificate '{domain}' status: {cert_data.get('ClientStatus', '')}")
+            still_pending.append(domain)
+        
+        pending = still_pending
+        if not pending:
+            return True, None
+        
+        # Wait before checking again, backing off up to the maximum interval
+        remaining = timeout - (time.time() - start_time)
+        await asyncio.sleep(max(0.0, min(interval, remaining)))
+        interval = min(interval * CERT_POLL_BACKOFF, CERT_POLL_MAX_INTERVAL)
     
-    return False, f"Timeout waiting for certificate '{domain}' to be issued after {timeout} seconds"
+    return False, f"Timeout waiting for certificates {pending} to be issued after {timeout} seconds"
 
 
-def deploy_service(service: Dict[str, Any], app_name: str, detach: bool = False, silent: bool = False) -> Tuple[bool, Optional[str]]:
+async def deploy_service(service: ServiceInfo, app_name: str, detach: bool = False, silent: bool = False) -> Tuple[bool, Optional[str]]:
     """Deploy a service to Fly.io. Returns (success, error_message)."""
     if not silent:
-        print(f"🚀 Deploying service '{service['name']}' to app '{app_name}'...")
+        _log(f"🚀 Deploying service '{service.name}' to app '{app_name}'...")
     
-    service_type = service.get('type', 'go')
-    deploy_path = service['path']
+    service_type = service.type
+    deploy_path = service.path
     dockerfile_location = 'Dockerfile'
     
     # Handle remote services
     if service_type == 'remote':
         if not silent:
-            print(f"🌀 Preparing remote service '{service['name']}'...")
+            _log(f"🌀 Preparing remote service '{service.name}'...")
         
         # Clone remote repository
-        success, error_msg, build_path = clone_remote_repository(service, silent=silent)
+        success, error_msg, build_path = await clone_remote_repository(service, silent=silent)
         if not success:
             return False, f"Failed to clone remote repository: {error_msg}"
         
         # Use the build directory for deployment
         deploy_path = build_path
-        dockerfile_location = service['config'].get('dockerfile_location', './Dockerfile')
+        dockerfile_location = service.config.get('dockerfile_location', './Dockerfile')
     
-    fly_toml = service['path'] / 'fly.toml'
-    if not fly_toml.exists():
-        error_msg = f"fly.toml not found for service '{service['name']}'"
-        if not silent:
-            print(f"❌ {error_msg}")
-        return False, error_msg
+    # fly.toml presence is validated up front in _deploy_services_parallel
+    # Run the deployment from the deployment directory
+    cmd = ['flyctl', 'deploy', '--config', str(service.fly_toml_path), '--app', app_name, '--remote-only']
+    if detach:
+        cmd.append('--detach')
     
-    # Change to deployment directory before deployment
-    original_cwd = os.getcwd()
-    try:
-        os.chdir(deploy_path)
-        
-        cmd = ['flyctl', 'deploy', '--config', str(service['path'] / 'fly.toml'), '--app', app_name, '--remote-only']
-        if detach:
-            cmd.append('--detach')
-        
-        # For remote services, specify dockerfile location if different from default
-        if service_type == 'remote' and dockerfile_location != 'Dockerfile':
-            cmd.extend(['--dockerfile', dockerfile_location])
-        
-        result = run_command(cmd, check=False, silent=silent)
-        if result.returncode == 0:
-            return True, None
-        else:
-            return False, f"Exit code {result.returncode}: {result.stderr.strip() if result.stderr else 'Unknown error'}"
-    finally:
-        # Always restore original working directory
-        os.chdir(original_cwd)
+    # For remote services, specify dockerfile location if different from default
+    if service_type == 'remote' and dockerfile_location != 'Dockerfile':
+        cmd.extend(['--dockerfile', dockerfile_location])
+    
+    result = await run_command(cmd, check=False, silent=silent, cwd=deploy_path, capture=not silent)
+    if result.returncode == 0:
+        return True, None
+    else:
+        return False, f"Exit code {result.returncode}: {result.stderr.strip() if result.stderr else 'Unknown error'}"
 
 
-def deploy_single_service_worker(service: Dict[str, Any], org: str = "personal", detach: bool = False) -> Tuple[str, bool, str, Optional[str]]:
+async def ensure_certificates(service: ServiceInfo, app_existed: bool = True) -> Tuple[bool, Optional[str]]:
+    """Add any missing SSL certificates for a service's domain and its www subdomain. Returns (success, error_message)."""
+    service_name = service.name
+    app_name = service.app_name
+    domain = service.domain
+    
+    # Check for both regular and www certificates
+    www_domain = f"www.{domain}"
+    missing_certs = []
+    
+    # A freshly created app has no certificates, so only list them for existing apps
+    existing_certs = await get_app_certificates(app_name) if app_existed else set()
+    
+    # Check regular domain first, then www domain
+    # Ordering is intentional: regular certs are processed first, then www certs
+    if domain not in existing_certs:
+        missing_certs.append(domain)
+    
+    if www_domain not in existing_certs:
+        missing_certs.append(www_domain)
+    
+    # Add missing certificates
+    if missing_certs:
+        _log(f"🔒 [{service_name}] Adding SSL certificates for: {missing_certs}")
+        success, error_msg = await add_certificate(app_name, missing_certs, silent=True)
+        if not success:
+            return False, f"Failed to add certificates for {missing_certs}: {error_msg}"
+        _log(f"✅ [{service_name}] Certificates added successfully")
+    else:
+        _log(f"✅ [{service_name}] All certificates already exist")
+    
+    return True, None
+
+
+async def deploy_single_service_worker(service: ServiceInfo, org: str = "personal", detach: bool = False,
+                                       existing_apps: Optional[Set[str]] = None) -> Tuple[str, bool, str, Optional[BaseException]]:
     """
-    Deploy a single service in a separate thread.
-    Note: DNS is handled separately, but certificates are managed per service.
-    Returns: (service_name, success, message, full_traceback)
+    Deploy a single service as a coroutine on the shared event loop.
+    Note: DNS is handled separately, but certificates are managed per service
+    and provisioned while the deployment is running.
+    existing_apps is the prefetched set of app names; when it is None (omitted, or the
+    listing failed) the app is created optimistically, an "already exists" error is
+    treated as success, and its certificates are still listed before adding any.
+    Returns: (service_name, success, message, exception); the exception keeps its
+    traceback so it is only formatted if the failure gets reported.
     """
-    service_name = service['name']
-    app_name = f"shmuel-tech-{service_name}"
+    service_name = service.name
+    app_name = service.app_name
+    cert_task = None
     
     try:
-        # Thread-safe logging with lock
-        with _print_lock:
-            print(f"🚀 [{service_name}] Starting deployment...")
+        _log(f"🚀 [{service_name}] Starting deployment...")
         
         # Create app if it doesn't exist
-        if not app_exists(app_name, silent=True):
-            with _print_lock:
-                print(f"📱 [{service_name}] Creating new Fly.io app: {app_name}")
-            success, error_msg = create_app(app_name, org, silent=True)
+        if existing_apps is None:
+            # Without a prefetched app list, create optimistically instead of listing
+            # all apps first, treating "already exists" as success
+            _log(f"📱 [{service_name}] Ensuring Fly.io app exists: {app_name}")
+            success, error_msg = await create_app(app_name, org, silent=True, accept_existing=True)
+            if not success:
+                return (service_name, False, f"Failed to create app '{app_name}': {error_msg}", None)
+            # The app may have existed before, so its certificates still need listing
+            app_existed = True
+        elif app_name not in existing_apps:
+            app_existed = False
+            _log(f"📱 [{service_name}] Creating new Fly.io app: {app_name}")
+            success, error_msg = await create_app(app_name, org, silent=True)
             if not success:
                 return (service_name, False, f"Failed to create app '{app_name}': {error_msg}", None)
-            with _print_lock:
-                print(f"✅ [{service_name}] App created successfully")
+            _log(f"✅ [{service_name}] App created successfully")
         else:
-            with _print_lock:
-                print(f"✅ [{service_name}] App '{app_name}' already exists")
-        
-        # Deploy service first (before certificates)
-        with _print_lock:
-            print(f"🚀 [{service_name}] Starting service deployment...")
-        success, error_msg = deploy_service(service, app_name, detach, silent=True)
-        if not success:
-            with _print_lock:
-                print(f"❌ [{service_name}] Service deployment failed: {error_msg}")
-            return (service_name, False, f"Failed to deploy to '{app_name}': {error_msg}", None)
+            app_existed = True
+            _log(f"✅ [{service_name}] App '{app_name}' already exists")
         
-        with _print_lock:
-            print(f"✅ [{service_name}] Service deployed successfully")
-        
-        # Add SSL certificates after deployment (when app is running)
+        # Certificate issuance only needs the app to exist, so start it in the
+        # background instead of waiting for the deployment to finish first.
         # Some services don't need shmuel.tech domain certificates, like DNS proxy service
-        dns_enabled = service['config'].get('dns_enabled', True)
-        if dns_enabled:
-            if service_name == "main-site":
-                domain = "shmuel.tech"
-            else:
-                domain = f"{service_name}.shmuel.tech"
-            
-            # Check for both regular and www certificates
-            www_domain = f"www.{domain}"
-            missing_certs = []
-            
-            # Check regular domain first, then www domain
-            # Ordering is intentional: regular certs are processed first, then www certs
-            if not cert_exists(app_name, domain, silent=True):
-                missing_certs.append(domain)
-            
-            if not cert_exists(app_name, www_domain, silent=True):
-                missing_certs.append(www_domain)
-            
-            # Add missing certificates
-            if missing_certs:
-                with _print_lock:
-                    print(f"🔒 [{service_name}] Adding SSL certificates for: {missing_certs}")
-                success, error_msg = add_certificate(app_name, missing_certs, silent=True)
-                if not success:
-                    return (service_name, False, f"Failed to add certificates for {missing_certs}: {error_msg}", None)
-                with _print_lock:
-                    print(f"✅ [{service_name}] Certificates added successfully")
-            else:
-                with _print_lock:
-                    print(f"✅ [{service_name}] All certificates already exist")
+        if service.config.get('dns_enabled', True):
+            cert_task = asyncio.create_task(ensure_certificates(service, app_existed))
+        elif service_name == "dns-proxy":
+            _log(f"⏭️  [{service_name}] Skipping certificate setup (DNS proxy service)")
         else:
-            if service_name == "dns-proxy":
-                with _print_lock:
-                    print(f"⏭️  [{service_name}] Skipping certificate setup (DNS proxy service)")
-            else:
-                with _print_lock:
-                    print(f"⏭️  [{service_name}] Skipping certificate setup (DNS disabled in config)")
+            _log(f"⏭️  [{service_name}] Skipping certificate setup (DNS disabled in config)")
+        
+        _log(f"🚀 [{service_name}] Starting service deployment...")
+        deploy_success, deploy_error = await deploy_service(service, app_name, detach, silent=True)
+        if deploy_success:
+            _log(f"✅ [{service_name}] Service deployed successfully")
+        else:
+            _log(f"❌ [{service_name}] Service deployment failed: {deploy_error}")
+        
+        if not deploy_success:
+            return (service_name, False, f"Failed to deploy to '{app_name}': {deploy_error}", None)
+        
+        # Let certificate work finish before reporting success
+        cert_success, cert_error = await cert_task if cert_task else (True, None)
+        if not cert_success:
+            return (service_name, False, cert_error, None)
         
         return (service_name, True, f"Successfully deployed to '{app_name}'", None)
             
     except Exception as e:
-        # Capture full traceback
-        full_traceback = traceback.format_exc()
-        with _print_lock:
-            print(f"💥 [{service_name}] Exception during deployment: {str(e)}")
-        return (service_name, False, f"Exception during deployment: {str(e)}", full_traceback)
+        _log(f"💥 [{service_name}] Exception during deployment: {str(e)}")
+        return (service_name, False, f"Exception during deployment: {str(e)}", e)
+    finally:
+        # On any non-success exit, don't hold a deployment slot (or keep logging)
+        # waiting on certificates for a failed deploy
+        if cert_task and not cert_task.done():
+            cert_task.cancel()
+            await asyncio.gather(cert_task, return_exceptions=True)
 
 
-def deploy_all_services(services_dir: Path, org: str = "personal", detach: bool = False, enable_dns: bool = True) -> bool:
-    """Deploy all services to Fly.io using parallel deployment."""
-    print("🚀 Starting deployment of all services...")
-    
+def _check_deploy_prerequisites(enable_dns: bool) -> Tuple[bool, bool]:
+    """Check Fly.io auth and DNS proxy credentials for the deploy entry points. Returns (authenticated, enable_dns)."""
     if not check_fly_auth():
         print("❌ Not authenticated with Fly.io. Run 'fly auth login' first.")
-        return False
+        return False, enable_dns
     
     # Check DNS credentials if DNS is enabled
     if enable_dns:
@@ -431,6 +681,18 @@ def deploy_all_services(services_dir: Path, org: str = "personal", detach: bool
             print(f"❌ DNS automation disabled: {e}")
             enable_dns = False
     
+    return True, enable_dns
+
+
+async def deploy_all_services(services_dir: Path, org: str = "personal", detach: bool = False, enable_dns: bool = True,
+                              max_parallel: Optional[int] = None) -> bool:
+    """Deploy all services to Fly.io using parallel deployment."""
+    print("🚀 Starting deployment of all services...")
+    
+    authenticated, enable_dns = _check_deploy_prerequisites(enable_dns)
+    if not authenticated:
+        return False
+    
     services = get_services(services_dir)
     if not services:
         print("❌ No services found to deploy.")
@@ -438,7 +700,7 @@ def deploy_all_services(services_dir: Path, org: str = "personal", detach: bool
     
     print(f"📋 Found {len(services)} services to deploy:")
     for service in services:
-        print(f"  - {service['name']} ({service['type']})")
+        print(f"  - {service.name} ({service.type})")
     
     if enable_dns:
         print("🌐 DNS automation enabled")
@@ -446,26 +708,18 @@ def deploy_all_services(services_dir: Path, org: str = "personal", detach: bool
         print("⚠️  DNS automation disabled, using manual certificate method")
     
     # Deploy all services in parallel
-    return _deploy_services_parallel(services, org, detach, enable_dns)
+    return await _deploy_services_parallel(services, org, detach, enable_dns, max_parallel)
 
 
-def deploy_specific_services(service_names: List[str], services_dir: Path, org: str = "personal", detach: bool = False, enable_dns: bool = True) -> bool:
+async def deploy_specific_services(service_names: List[str], services_dir: Path, org: str = "personal", detach: bool = False, enable_dns: bool = True,
+                                   max_parallel: Optional[int] = None) -> bool:
     """Deploy specific services to Fly.io using parallel deployment."""
     print(f"🚀 Deploying specific services: {', '.join(service_names)}")
     
-    if not check_fly_auth():
-        print("❌ Not authenticated with Fly.io. Run 'fly auth login' first.")
+    authenticated, enable_dns = _check_deploy_prerequisites(enable_dns)
+    if not authenticated:
         return False
     
-    # Check DNS credentials if DNS is enabled
-    if enable_dns:
-        try:
-            get_dns_proxy_config()
-            print("✅ DNS proxy credentials found")
-        except ValueError as e:
-            print(f"❌ DNS automation disabled: {e}")
-            enable_dns = False
-    
     # Validate all services exist first
     services_to_deploy = []
     for service_name in service_names:
@@ -474,18 +728,11 @@ def deploy_specific_services(service_names: List[str], services_dir: Path, org:
             print(f"❌ Service '{service_name}' not found in {services_dir}")
             return False
         
-        config = get_service_config(service_path)
-        service = {
-            'name': service_name,
-            'path': service_path,
-            'type': config.get('service_type', 'go'),
-            'config': config
-        }
-        services_to_deploy.append(service)
+        services_to_deploy.append(ServiceInfo.from_dir(service_path))
     
     print(f"📋 Found {len(services_to_deploy)} services to deploy:")
     for service in services_to_deploy:
-        print(f"  - {service['name']} ({service['type']})")
+        print(f"  - {service.name} ({service.type})")
     
     if enable_dns:
         print("🌐 DNS automation enabled")
@@ -493,13 +740,24 @@ def deploy_specific_services(service_names: List[str], services_dir: Path, org:
         print("⚠️  DNS automation disabled, using manual certificate method")
     
     # Deploy all services in parallel
-    return _deploy_services_parallel(services_to_deploy, org, detach, enable_dns)
+    return await _deploy_services_parallel(services_to_deploy, org, detach, enable_dns, max_parallel)
 
 
-def _deploy_services_parallel(services: List[Dict[str, Any]], org: str = "personal", detach: bool = False, enable_dns: bool = True) -> bool:
-    """Deploy multiple services with bulk DNS updates and parallel deployment."""
+async def _deploy_services_parallel(services: List[ServiceInfo], org: str = "personal", detach: bool = False, enable_dns: bool = True,
+                                    max_parallel: Optional[int] = None) -> bool:
+    """Deploy multiple services with bulk DNS updates and parallel deployment.
+    
+    At most max_parallel services are deployed at once (default: twice the CPU count).
+    """
     print(f"\n🔄 Starting deployment of {len(services)} services...")
     
+    # Fail fast on missing fly.toml files before touching DNS, apps or certificates
+    missing_fly_toml = [service.name for service in services if not service.fly_toml_path.is_file()]
+    if missing_fly_toml:
+        for service_name in missing_fly_toml:
+            print(f"❌ fly.toml not found for service '{service_name}'")
+        return False
+    
     # Step 1: Bulk DNS update (if enabled)
     print(f"\n🌐 Step 1: Bulk DNS update for all services...")
 
@@ -510,7 +768,7 @@ def _deploy_services_parallel(services: List[Dict[str, Any]], org: str = "person
         # and we don't want to bother with manual bootstrapping step
         service_configs = []
         for service in services:
-            service_name = service['name']
+            service_name = service.name
             
             # Skip DNS proxy service from DNS automation
             if service_name == 'dns-proxy':
@@ -518,14 +776,13 @@ def _deploy_services_parallel(services: List[Dict[str, Any]], org: str = "person
                 continue
             
             # Skip services with DNS disabled
-            if not service['config'].get('dns_enabled', True):
+            if not service.config.get('dns_enabled', True):
                 print(f"⏭️  Skipping DNS for '{service_name}' - DNS disabled in config")
                 continue
                 
-            app_name = f"shmuel-tech-{service_name}"
             service_configs.append({
                 'service_name': service_name,
-                'app_name': app_name
+                'app_name': service.app_name
             })
         
         try:
@@ -542,28 +799,49 @@ def _deploy_services_parallel(services: List[Dict[str, Any]], org: str = "person
     # Step 2: Deploy all services in parallel (including certificates)
     print(f"\n🚀 Step 2: Parallel deployment of all services...")
     
-    # Use ThreadPoolExecutor to deploy services in parallel
-    results = []
-    with ThreadPoolExecutor(max_workers=len(services)) as executor:
-        # Submit all deployment tasks
-        future_to_service = {
-            executor.submit(deploy_single_service_worker, service, org, detach): service['name']
-            for service in services
-        }
+    # Look up existing apps once instead of once per service; if that fails, each
+    # worker creates its app optimistically (see deploy_single_service_worker)
+    existing_apps = await get_existing_apps()
+    if existing_apps is None:
+        print("⚠️  Could not list existing Fly.io apps - creating apps optimistically")
+    
+    # Bound the number of concurrent deployments so the Fly.io API is not flooded
+    if max_parallel is None:
+        max_parallel = (os.cpu_count() or 1) * 2
+    semaphore = asyncio.Semaphore(max(1, min(len(services), max_parallel)))
+    
+    completed = 0
+    
+    async def bounded_worker(service: ServiceInfo) -> Tuple[str, bool, str, Optional[BaseException]]:
+        nonlocal completed
+        async with semaphore:
+            result = await deploy_single_service_worker(service, org, detach, existing_apps)
         
-        # Collect results as they complete
-        for future in as_completed(future_to_service):
-            service_name = future_to_service[future]
-            try:
-                result = future.result()
-                results.append(result)
-            except Exception as e:
-                full_traceback = traceback.format_exc()
-                results.append((service_name, False, f"Unexpected error: {str(e)}", full_traceback))
-    
-    # Sort results by service name for consistent output
-    results.sort(key=lambda x: x[0])
+        # Report each outcome as soon as it is known; the full table follows at the end
+        completed += 1
+        _, success, message, _ = result
+        _log(f"{'✅' if success else '❌'} [{service.name}] Finished ({completed}/{len(services)}): {message}")
+        return result
+    
+    # Run all deployment coroutines concurrently on the event loop
+    outcomes = await asyncio.gather(
+        *(bounded_worker(service) for service in services),
+        return_exceptions=True
+    )
+    
+    # Make sure all queued worker output is written before the results
+    _log_q.join()
+    
+    # Collect results, converting unexpected exceptions into failed results
+    results = []
+    for service, outcome in zip(services, outcomes):
+        if isinstance(outcome, BaseException):
+            results.append((service.name, False, f"Unexpected error: {str(outcome)}", outcome))
+        else:
+            results.append(outcome)
     
+    # Results are already in submission order (asyncio.gather preserves it), which
+    # matches the "Found N services" listing printed before deployment
     # Print results sequentially
     print(f"\n{'='*60}")
     print(f"📊 Deployment Results")
@@ -573,14 +851,14 @@ def _deploy_services_parallel(services: List[Dict[str, Any]], org: str = "person
     error_count = 0
     failed_services = []
     
-    for service_name, success, message, full_traceback in results:
+    for service_name, success, message, error in results:
         if success:
             print(f"✅ {service_name}: {message}")
             success_count += 1
         else:
             print(f"❌ {service_name}: {message}")
             error_count += 1
-            failed_services.append((service_name, message, full_traceback))
+            failed_services.append((service_name, message, error))
     
     # Print summary
     print(f"\n{'='*60}")
@@ -596,11 +874,12 @@ def _deploy_services_parallel(services: List[Dict[str, Any]], org: str = "person
         print(f"🔍 Detailed Error Information")
         print(f"{'='*60}")
         
-        for service_name, message, full_traceback in failed_services:
+        for service_name, message, error in failed_services:
             print(f"\n{service_name} full error details:")
             print(f"---{'-'*50}---")
-            if full_traceback:
-                print(full_traceback)
+            if error is not None:
+                # Tracebacks are formatted only here, for failures that are actually shown
+                print(''.join(traceback.format_exception(error)))
             else:
                 print(f"Error: {message}")
             print(f"---{'-'*50}---")
@@ -620,11 +899,13 @@ def main():
     parser.add_argument('--detach', '-d', action='store_true', help='Detach from deployment process')
     parser.add_argument('--services-dir', default='services', help='Services directory (default: services)')
     parser.add_argument('--no-dns', action='store_true', help='Disable DNS automation (use manual certificate method)')
+    parser.add_argument('--max-parallel', '-j', type=int, default=None,
+                        help='Maximum number of services deployed at once (default: twice the CPU count)')
     
     args = parser.parse_args()
     
     # Get project root directory
-    project_root = Path(__file__).parent.parent
+    project_root = PROJECT_ROOT
     services_dir = project_root / args.services_dir
     
     if not services_dir.exists():
@@ -639,9 +920,9 @@ def main():
     
     try:
         if args.service:
-            success = deploy_specific_services(args.service, services_dir, args.org, args.detach, enable_dns)
+            success = asyncio.run(deploy_specific_services(args.service, services_dir, args.org, args.detach, enable_dns, args.max_parallel))
         else:
-            success = deploy_all_services(services_dir, args.org, args.detach, enable_dns)
+            success = asyncio.run(deploy_all_services(services_dir, args.org, args.detach, enable_dns, args.max_parallel))
         
         sys.exit(0 if success else 1)
         
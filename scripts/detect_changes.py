@@ -5,78 +5,217 @@ Used by CI/CD to only deploy services that actually changed.
 """
 
 import argparse
+import os
+import shutil
 import subprocess
 import sys
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
 from pathlib import Path
-from typing import List, Set
+from typing import Dict, FrozenSet, Iterator, List, Optional, Set, Tuple
 
+from .utils import PROJECT_ROOT, list_service_names
+
+# Resolve git once rather than searching PATH on every invocation
+GIT = shutil.which('git') or 'git'
+
+# Changes under these paths (a file, or a directory ending in /) affect every service
+ROOT_CHANGE_PATHS = (
+    "docker-compose.yml",
+    "Makefile",
+    ".github/workflows/",
+    "scripts/deploy.py",
+    "scripts/service_handler.py",
+)
 
-def run_git_command(cmd: List[str], verbose: bool = False) -> str:
-    """Run a git command and return the output."""
-    try:
-        result = subprocess.run(['git'] + cmd, check=True, capture_output=True, text=True)
-        return result.stdout.strip()
-    except subprocess.CalledProcessError as e:
-        print(f"❌ Git command failed: {e}", file=sys.stderr)
-        if e.stderr:
-            print(f"Error: {e.stderr.strip()}", file=sys.stderr)
-        sys.exit(1)
 
+def get_merge_base(base_ref: str, head_ref: str = "HEAD") -> Optional[str]:
+    """Get the merge base of two git references, or None if there is none (e.g. shallow clones)."""
+    result = subprocess.run([GIT, 'merge-base', base_ref, head_ref], capture_output=True, cwd=PROJECT_ROOT)
+    if result.returncode != 0:
+        return None
+    return os.fsdecode(result.stdout).strip()
 
-def get_changed_files(base_ref: str, head_ref: str = "HEAD", verbose: bool = False) -> List[str]:
-    """Get list of changed files between two git references."""
+
+def _resolve_diff_base(base_ref: str, head_ref: str, two_dot: bool, verbose: bool) -> str:
+    """Return the reference to diff head_ref against (the merge base unless two_dot is set)."""
+    if two_dot:
+        return base_ref
+    
+    merge_base = get_merge_base(base_ref, head_ref)
+    if merge_base:
+        return merge_base
     if verbose:
-        print(f"🔍 Detecting changes between {base_ref} and {head_ref}", file=sys.stderr)
+        print(f"⚠️  No merge base found for {base_ref} and {head_ref} - comparing them directly", file=sys.stderr)
+    return base_ref
+
+
+def _iter_diff_tree(base_ref: str, head_ref: str, pathspecs: Optional[List[str]] = None) -> Iterator[str]:
+    """
+    Yield the files changed between two git references as git reports them,
+    optionally limited to pathspecs. Closing the generator early stops git.
+    """
+    # Get list of changed files, NUL-delimited so any filename parses correctly.
+    # diff-tree is the plumbing behind git diff: it only compares the two trees,
+    # without loading diff drivers or attributes. Renames are reported as a
+    # deletion plus an addition, so both the old and the new location count as changed.
+    # Pathspecs are applied during git's tree walk, so unrelated paths never reach us.
+    cmd = [GIT, "diff-tree", "-r", "--no-commit-id", "--name-only", "--no-renames", "-z", base_ref, head_ref]
+    if pathspecs:
+        cmd += ["--", *pathspecs]
     
-    # Get list of changed files
-    cmd = ["diff", "--name-only", base_ref, head_ref]
-    output = run_git_command(cmd, verbose)
+    # Run from the repository root: pathspecs are resolved against git's working directory
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=PROJECT_ROOT) as proc:
+        try:
+            pending = b''
+            for chunk in iter(lambda: proc.stdout.read1(65536), b''):
+                # The last piece may be a partial name continued in the next chunk
+                *names, pending = (pending + chunk).split(b'\0')
+                for name in names:
+                    if name:
+                        yield os.fsdecode(name)
+            
+            stderr = proc.stderr.read()
+            if proc.wait() != 0:
+                print(f"❌ Git command failed: {' '.join(cmd)} returned {proc.returncode}", file=sys.stderr)
+                if stderr:
+                    print(f"Error: {os.fsdecode(stderr).strip()}", file=sys.stderr)
+                sys.exit(1)
+        finally:
+            # Stop git if the caller stopped reading before the listing ended
+            if proc.poll() is None:
+                proc.terminate()
+
+
+def _normalize_redeploy_path(path) -> Optional[str]:
+    """
+    Turn a 'redeploy_on' entry into a repository-relative path without a trailing
+    slash, or None if it can't be used (not a string, empty, a glob, pathspec magic,
+    or pointing outside the repository).
+    """
+    if not isinstance(path, str):
+        return None
+    path = path.strip()
+    while path.startswith('./'):
+        path = path[2:]
+    path = path.strip('/')
+    if not path or path.startswith(':') or any(c in path for c in '*?[') or '..' in path.split('/'):
+        return None
+    return path
+
+
+def load_deploy_graph(services_dir: Path) -> Dict[str, Set[str]]:
+    """
+    Map root paths to the services that should be redeployed when they change.
     
-    if not output:
-        if verbose:
-            print("📋 No changes detected", file=sys.stderr)
-        return []
+    Each service can list paths outside its own directory under 'redeploy_on' in its
+    .shmuel-tech.json, relative to the repository root: a file, or a directory whose
+    whole contents count (e.g. "shared" or "shared/"). Globs are not supported;
+    unusable entries are reported and ignored.
+    """
+    import json
     
-    changed_files = output.split('\n')
-    if verbose:
-        print(f"📋 Found {len(changed_files)} changed files:", file=sys.stderr)
-        for file in changed_files:
-            print(f"  - {file}", file=sys.stderr)
+    deploy_graph = {}
+    for service_name in sorted(list_service_names(services_dir)):
+        try:
+            with open(services_dir / service_name / ".shmuel-tech.json", 'r') as f:
+                redeploy_on = json.load(f).get('redeploy_on', [])
+        except (OSError, json.JSONDecodeError, AttributeError):
+            # Missing or invalid configs are reported by deploy; they just add no entries here
+            continue
+        
+        if not isinstance(redeploy_on, list):
+            print(f"⚠️  Ignoring 'redeploy_on' of service '{service_name}': expected a list of paths", file=sys.stderr)
+            continue
+        
+        for entry in redeploy_on:
+            path = _normalize_redeploy_path(entry)
+            if path is None:
+                print(f"⚠️  Ignoring 'redeploy_on' entry {entry!r} of service '{service_name}': "
+                      f"expected a file or directory path in the repository (no globs)", file=sys.stderr)
+                continue
+            deploy_graph.setdefault(path, set()).add(service_name)
     
-    return changed_files
+    return deploy_graph
+
+
+def _path_matches(file_path: str, path: str) -> bool:
+    """Check whether file_path is the file path or lies in the directory path (with or without a trailing /)."""
+    path = path.rstrip('/')
+    return file_path == path or file_path.startswith(path + '/')
+
+
+def get_root_changes(base_ref: str, head_ref: str = "HEAD",
+                     deploy_graph: Optional[Dict[str, Set[str]]] = None) -> Tuple[Optional[str], Dict[str, Set[str]]]:
+    """
+    Scan the changed root files between two git references (compared directly).
+    
+    Files listed in deploy_graph only redeploy the services that list them; any other
+    change under ROOT_CHANGE_PATHS redeploys every service, so git is stopped at the
+    first such file.
+    Returns (file that redeploys every service or None, changed file -> targeted services).
+    """
+    deploy_graph = deploy_graph or {}
+    pathspecs = list(ROOT_CHANGE_PATHS) + [path for path in deploy_graph if path not in ROOT_CHANGE_PATHS]
+    targeted = {}
+    
+    with closing(_iter_diff_tree(base_ref, head_ref, pathspecs)) as files:
+        for file_path in files:
+            services = set()
+            for path, path_services in deploy_graph.items():
+                if _path_matches(file_path, path):
+                    services |= path_services
+            
+            if services:
+                targeted[file_path] = services
+            elif any(_path_matches(file_path, path) for path in ROOT_CHANGE_PATHS):
+                return file_path, targeted
+    
+    return None, targeted
+
+
+def get_changed_service_files(base_ref: str, head_ref: str = "HEAD", services_dir: str = "services") -> List[str]:
+    """Get list of changed files under services_dir between two git references (compared directly)."""
+    return list(_iter_diff_tree(base_ref, head_ref, [f"{services_dir}/"]))
+
+
+def _print_changed_files(changed_files: List[str]):
+    """Print the changed-file listing to stderr."""
+    if not changed_files:
+        print("📋 No changes detected", file=sys.stderr)
+        return
+    
+    print(f"📋 Found {len(changed_files)} changed files:", file=sys.stderr)
+    # Emit the whole listing with one write instead of one print per file
+    sys.stderr.write("".join(f"  - {file}\n" for file in changed_files))
 
 
 def get_changed_services(changed_files: List[str], services_dir: str = "services") -> Set[str]:
     """Extract service names from changed file paths."""
     changed_services = set()
+    prefix = f"{services_dir}/"
+    prefix_len = len(prefix)
     
     for file_path in changed_files:
-        if file_path.startswith(f"{services_dir}/"):
-            # Extract service name from path like "services/main-site/..."
-            path_parts = file_path.split('/')
-            if len(path_parts) >= 2:
-                service_name = path_parts[1]
+        if file_path.startswith(prefix):
+            # Extract service name from path like "services/main-site/...",
+            # stopping at the first slash after the prefix
+            end = file_path.find('/', prefix_len)
+            service_name = file_path[prefix_len:] if end < 0 else file_path[prefix_len:end]
+            if service_name:
                 changed_services.add(service_name)
     
     return changed_services
 
 
-def get_all_services(services_dir: Path) -> Set[str]:
+def get_all_services(services_dir: Path) -> FrozenSet[str]:
     """Get list of all available services."""
-    services = set()
-    
-    if not services_dir.exists():
-        return services
-    
-    for service_dir in services_dir.iterdir():
-        if service_dir.is_dir() and not service_dir.name.startswith('.'):
-            services.add(service_dir.name)
-    
-    return services
+    return list_service_names(services_dir)
 
 
 def detect_changes(base_ref: str, head_ref: str = "HEAD", services_dir_name: str = "services", 
-                  force_all: bool = False, include_root_changes: bool = True, verbose: bool = False) -> List[str]:
+                  force_all: bool = False, include_root_changes: bool = True, verbose: bool = False,
+                  two_dot: bool = False) -> List[str]:
     """
     Detect which services have changes.
     
@@ -85,13 +224,15 @@ def detect_changes(base_ref: str, head_ref: str = "HEAD", services_dir_name: str
         head_ref: Head git reference (default: HEAD)
         services_dir_name: Name of services directory
         force_all: If True, return all services regardless of changes
-        include_root_changes: If True, deploy all services when root files change
+        include_root_changes: If True, deploy all services when root files change (or only the
+            services that list the changed file under 'redeploy_on', see load_deploy_graph)
         verbose: If True, print debug information to stderr
+        two_dot: If True, diff base_ref and head_ref directly instead of from their merge base
     
     Returns:
         List of service names that should be deployed
     """
-    project_root = Path(__file__).parent.parent
+    project_root = PROJECT_ROOT
     services_dir = project_root / services_dir_name
     
     all_services = get_all_services(services_dir)
@@ -99,7 +240,7 @@ def detect_changes(base_ref: str, head_ref: str = "HEAD", services_dir_name: str
     if force_all:
         if verbose:
             print("🚀 Force deployment requested - returning all services", file=sys.stderr)
-        return sorted(list(all_services))
+        return sorted(all_services)
     
     if not all_services:
         if verbose:
@@ -109,40 +250,44 @@ def detect_changes(base_ref: str, head_ref: str = "HEAD", services_dir_name: str
     if verbose:
         print(f"📂 Available services: {', '.join(sorted(all_services))}", file=sys.stderr)
     
-    changed_files = get_changed_files(base_ref, head_ref, verbose)
+    if verbose:
+        print(f"🔍 Detecting changes between {base_ref} and {head_ref}", file=sys.stderr)
     
-    if not changed_files:
+    diff_base = _resolve_diff_base(base_ref, head_ref, two_dot, verbose)
+    deploy_graph = load_deploy_graph(services_dir) if include_root_changes else {}
+    
+    # The root and service queries cover disjoint paths and only read the
+    # repository, so run both git processes at the same time
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        root_future = executor.submit(get_root_changes, diff_base, head_ref, deploy_graph) if include_root_changes else None
+        service_future = executor.submit(get_changed_service_files, diff_base, head_ref, services_dir_name)
+        
+        # Check for root-level changes that affect all services
+        root_change, root_targets = root_future.result() if root_future else (None, {})
+        if root_change:
+            if verbose:
+                print(f"🔧 Root change detected in {root_change} - deploying all services", file=sys.stderr)
+            return sorted(all_services)
+        
+        changed_files = service_future.result()
+    
+    if verbose:
+        _print_changed_files(changed_files)
+    
+    if not changed_files and not root_targets:
         if verbose:
             print("📋 No changes detected - no services to deploy", file=sys.stderr)
         return []
     
-    # Check for root-level changes that affect all services
-    root_changes = False
-    if include_root_changes:
-        root_files = [
-            "docker-compose.yml",
-            "Makefile", 
-            ".github/workflows/",
-            "scripts/deploy.py",
-            "scripts/service_handler.py"
-        ]
-        
-        for file_path in changed_files:
-            for root_file in root_files:
-                if file_path.startswith(root_file):
-                    if verbose:
-                        print(f"🔧 Root change detected in {file_path} - deploying all services", file=sys.stderr)
-                    root_changes = True
-                    break
-            if root_changes:
-                break
-    
-    if root_changes:
-        return sorted(list(all_services))
-    
     # Get services with changes
     changed_services = get_changed_services(changed_files, services_dir_name)
     
+    # Add services that asked to be redeployed when these root files change
+    for file_path, services in root_targets.items():
+        if verbose:
+            print(f"🔧 Root change detected in {file_path} - deploying {', '.join(sorted(services))}", file=sys.stderr)
+        changed_services |= services
+    
     # Filter to only include services that actually exist
     valid_changed_services = changed_services.intersection(all_services)
     
@@ -153,7 +298,7 @@ def detect_changes(base_ref: str, head_ref: str = "HEAD", services_dir_name: str
     
     if verbose:
         print(f"🎯 Services with changes: {', '.join(sorted(valid_changed_services))}", file=sys.stderr)
-    return sorted(list(valid_changed_services))
+    return sorted(valid_changed_services)
 
 
 def main():
@@ -164,6 +309,8 @@ def main():
     parser.add_argument('--services-dir', default='services', help='Services directory name (default: services)')
     parser.add_argument('--force-all', action='store_true', help='Return all services regardless of changes')
     parser.add_argument('--no-root-changes', action='store_true', help='Don\'t deploy all services on root changes')
+    parser.add_argument('--two-dot', action='store_true',
+                       help='Compare base and head directly instead of from their merge base')
     parser.add_argument('--verbose', '-v', action='store_true', help='Print debug information to stderr')
     parser.add_argument('--output-format', choices=['list', 'space-separated', 'json'], default='space-separated',
                        help='Output format (default: space-separated)')
@@ -177,7 +324,8 @@ def main():
             services_dir_name=args.services_dir,
             force_all=args.force_all,
             include_root_changes=not args.no_root_changes,
-            verbose=args.verbose
+            verbose=args.verbose,
+            two_dot=args.two_dot
         )
         
         if not changed_services:
@@ -5,23 +5,24 @@ Fetches and displays app status information from Fly.io in table or JSON format.
 """
 
 import argparse
+import asyncio
+import functools
 import json
 import subprocess
 import sys
-from dataclasses import dataclass, field
-from datetime import datetime
+import time
+from dataclasses import asdict, dataclass, field
 from pathlib import Path
 from typing import List, Dict, Any, Optional
-from tabulate import tabulate
 
 # Import shared utilities
-from .utils import load_project_env, check_fly_auth, run_command
+from .utils import PROJECT_ROOT, load_project_env, check_fly_auth, list_service_names
 
 # Load environment variables
 load_project_env()
 
 
-@dataclass
+@dataclass(slots=True)
 class Organization:
     """Organization information."""
     id: str
@@ -32,7 +33,7 @@ class Organization:
     paid_plan: bool
 
 
-@dataclass
+@dataclass(slots=True)
 class ImageRef:
     """Docker image reference."""
     registry: str
@@ -41,7 +42,7 @@ class ImageRef:
     digest: str
 
 
-@dataclass
+@dataclass(slots=True)
 class GuestConfig:
     """Guest configuration for machine."""
     cpu_kind: str
@@ -49,7 +50,7 @@ class GuestConfig:
     memory_mb: int
 
 
-@dataclass
+@dataclass(slots=True)
 class ServicePort:
     """Service port configuration."""
     port: int
@@ -57,7 +58,7 @@ class ServicePort:
     force_https: Optional[bool] = None
 
 
-@dataclass
+@dataclass(slots=True)
 class ServiceCheck:
     """Service health check configuration."""
     type: str
@@ -68,7 +69,7 @@ class ServiceCheck:
     path: str
 
 
-@dataclass
+@dataclass(slots=True)
 class ServiceConfig:
     """Service configuration."""
     protocol: str
@@ -81,20 +82,20 @@ class ServiceConfig:
     force_instance_key: Optional[str] = None
 
 
-@dataclass
+@dataclass(slots=True)
 class RestartConfig:
     """Restart policy configuration."""
     policy: str
     max_retries: int
 
 
-@dataclass
+@dataclass(slots=True)
 class StopConfig:
     """Stop signal configuration."""
     signal: str
 
 
-@dataclass
+@dataclass(slots=True)
 class MachineConfig:
     """Machine configuration."""
     env: Dict[str, str]
@@ -107,7 +108,7 @@ class MachineConfig:
     stop_config: StopConfig
 
 
-@dataclass
+@dataclass(slots=True)
 class MachineEvent:
     """Machine event."""
     type: str
@@ -117,7 +118,7 @@ class MachineEvent:
     timestamp: int
 
 
-@dataclass
+@dataclass(slots=True)
 class MachineCheck:
     """Machine health check result."""
     name: str
@@ -126,7 +127,7 @@ class MachineCheck:
     updated_at: str
 
 
-@dataclass
+@dataclass(slots=True)
 class Machine:
     """Fly.io machine information."""
     id: str
@@ -144,7 +145,7 @@ class Machine:
     host_status: str
 
 
-@dataclass
+@dataclass(slots=True)
 class AppInfo:
     """Complete Fly.io app information."""
     app_url: str
@@ -282,22 +283,50 @@ def parse_app_info(data: Dict[str, Any]) -> AppInfo:
     )
 
 
-def get_app_info(app_name: str) -> AppInfo:
-    """Get app information from Fly.io."""
+async def get_app_info_async(app_name: str) -> AppInfo:
+    """Get app information from Fly.io without blocking the event loop."""
     print(f"📱 Getting app information for: {app_name}")
     
-    result = run_command(['flyctl', 'status', '--json', '--app', app_name], silent=True)
+    proc = await asyncio.create_subprocess_exec(
+        'flyctl', 'status', '--json', '--app', app_name,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    stdout, stderr = await proc.communicate()
+    if proc.returncode != 0:
+        raise RuntimeError(f"flyctl status failed for '{app_name}': {stderr.decode().strip()}")
     
-    try:    
-        data = json.loads(result.stdout)
-        return parse_app_info(data)
+    try:
+        data = json.loads(stdout)
     except json.JSONDecodeError as e:
-        print(f"❌ Failed to parse JSON response: {e}", file=sys.stderr)
-        sys.exit(1)
+        raise RuntimeError(f"Failed to parse JSON response for '{app_name}': {e}") from e
+    return parse_app_info(data)
 
 
+def get_app_info(app_name: str) -> AppInfo:
+    """Get app information from Fly.io."""
+    return asyncio.run(get_app_info_async(app_name))
+
+
+async def get_apps_info(app_names: List[str], max_parallel: int = 8) -> List[AppInfo]:
+    """
+    Get information for several apps concurrently, overlapping flyctl's network round trips.
+    At most max_parallel flyctl processes run at once. Results are in the order of app_names.
+    """
+    semaphore = asyncio.Semaphore(max_parallel)
+    
+    async def bounded_get(app_name: str) -> AppInfo:
+        async with semaphore:
+            return await get_app_info_async(app_name)
+    
+    return await asyncio.gather(*(bounded_get(app_name) for app_name in app_names))
+
+
+@functools.lru_cache(maxsize=8192)
 def format_datetime(dt_str: str) -> str:
-    """Format datetime string for display."""
+    """Format datetime string for display. Machines created together share timestamps, so results are cached."""
+    from datetime import datetime
+    
     try:
         dt = datetime.fromisoformat(dt_str.replace('Z', '+00:00'))
         return dt.strftime('%Y-%m-%d %H:%M:%S UTC')
@@ -305,17 +334,21 @@ def format_datetime(dt_str: str) -> str:
         return dt_str
 
 
+@functools.lru_cache(maxsize=8192)
 def format_timestamp(timestamp: int) -> str:
-    """Format timestamp for display."""
+    """Format timestamp for display. Results are cached, as events often share timestamps."""
     try:
-        dt = datetime.fromtimestamp(timestamp / 1000)  # Convert milliseconds to seconds
-        return dt.strftime('%Y-%m-%d %H:%M:%S')
-    except (ValueError, OSError):
+        # Convert milliseconds to seconds; time.localtime avoids building a datetime object
+        return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp / 1000))
+    except (ValueError, OSError, OverflowError):
         return str(timestamp)
 
 
 def display_table_format(app_info: AppInfo) -> None:
     """Display app information in table format."""
+    # Only the table view needs tabulate; importing it lazily keeps --json and --list-services fast
+    from tabulate import tabulate
+    
     print(f"\n🚀 Application Information: {app_info.name}")
     print("=" * 60)
     
@@ -357,9 +390,8 @@ def display_table_format(app_info: AppInfo) -> None:
             resources = f"{machine.config.guest.cpus} CPU, {machine.config.guest.memory_mb}MB RAM"
             
             # Get environment variables
-            env_vars = ", ".join(f"{k}={v}" for k, v in machine.config.env.items())
-            if not env_vars:
-                env_vars = "No environment variables"
+            env = machine.config.env
+            env_vars = ", ".join(f"{k}={v}" for k, v in env.items()) if env else "No environment variables"
             
             machines_table.append([
                 machine.id[:12] + "...",  # Truncate ID
@@ -399,24 +431,15 @@ def display_table_format(app_info: AppInfo) -> None:
         print("No machines found for this app.")
 
 
-def display_json_format(app_info: AppInfo) -> None:
-    """Display app information in JSON format."""
-    # Convert dataclass to dict for JSON serialization
-    def dataclass_to_dict(obj):
-        if hasattr(obj, '__dict__'):
-            return {k: dataclass_to_dict(v) for k, v in obj.__dict__.items()}
-        elif isinstance(obj, list):
-            return [dataclass_to_dict(item) for item in obj]
-        else:
-            return obj
-    
-    app_dict = dataclass_to_dict(app_info)
-    print(json.dumps(app_dict, indent=2))
+def display_json_format(apps_info: List[AppInfo], as_list: bool = False) -> None:
+    """Display app information in JSON format: a list if as_list, otherwise the single app's object."""
+    app_dicts = [asdict(app_info) for app_info in apps_info]
+    print(json.dumps(app_dicts if as_list else app_dicts[0], indent=2))
 
 
 def get_services_dir() -> Path:
     """Get the services directory path."""
-    project_root = Path(__file__).parent.parent
+    project_root = PROJECT_ROOT
     return project_root / "services"
 
 
@@ -427,16 +450,7 @@ def get_app_name_from_service(service_name: str) -> str:
 
 def list_available_services() -> List[str]:
     """List all available services."""
-    services_dir = get_services_dir()
-    if not services_dir.exists():
-        return []
-    
-    services = []
-    for service_dir in services_dir.iterdir():
-        if service_dir.is_dir() and not service_dir.name.startswith('.'):
-            services.append(service_dir.name)
-    
-    return sorted(services)
+    return sorted(list_service_names(get_services_dir()))
 
 
 def main():
@@ -444,7 +458,8 @@ def main():
     parser = argparse.ArgumentParser(description="Get Fly.io app information")
     parser.add_argument('app_name', nargs='?', help='App name or service name to get info for')
     parser.add_argument('--json', action='store_true', help='Output in JSON format')
-    parser.add_argument('--service', '-s', help='Service name (will be converted to app name)')
+    parser.add_argument('--service', '-s', action='append',
+                        help='Service name (will be converted to app name; can specify multiple)')
     parser.add_argument('--list-services', action='store_true', help='List available services')
     
     args = parser.parse_args()
@@ -460,12 +475,15 @@ def main():
             print("❌ No services found in services directory")
         return
     
-    # Determine app name
+    # Determine app names
     if args.service:
-        app_name = get_app_name_from_service(args.service)
-        print(f"🔄 Converting service '{args.service}' to app name '{app_name}'")
+        app_names = []
+        for service in args.service:
+            app_name = get_app_name_from_service(service)
+            print(f"🔄 Converting service '{service}' to app name '{app_name}'")
+            app_names.append(app_name)
     elif args.app_name:
-        app_name = args.app_name
+        app_names = [args.app_name]
     else:
         print("❌ Please provide either --service or an app name")
         print("💡 Use --list-services to see available services")
@@ -477,12 +495,14 @@ def main():
         sys.exit(1)
     
     try:
-        app_info = get_app_info(app_name)
+        apps_info = asyncio.run(get_apps_info(app_names))
         
         if args.json:
-            display_json_format(app_info)
+            # The shape follows the request, not the results: several --service flags give a list
+            display_json_format(apps_info, as_list=len(app_names) > 1)
         else:
-            display_table_format(app_info)
+            for app_info in apps_info:
+                display_table_format(app_info)
             
     except Exception as e:
         print(f"❌ Failed to get app information: {e}", file=sys.stderr)
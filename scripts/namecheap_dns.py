@@ -4,13 +4,18 @@ Namecheap DNS management for shmuel-tech monorepo.
 Handles DNS operations via Namecheap API through DNS proxy.
 """
 
+import atexit
+import hashlib
 import os
+import random
+import threading
 import requests
 import time
+from requests.adapters import HTTPAdapter
 from typing import List, Dict, Any, Tuple, Optional
 
 # Import shared utilities
-from .utils import load_project_env
+from .utils import PROJECT_ROOT, load_project_env
 
 # Load environment variables
 load_project_env()
@@ -18,8 +23,69 @@ load_project_env()
 # DNS Proxy configuration
 NAMECHEAP_DOMAIN = "shmuel.tech"
 
+# Namecheap allows ~20 API calls per minute; keep calls at least this far apart
+NAMECHEAP_MIN_SPACING = 3.1
+NAMECHEAP_SPACING_JITTER = 0.5
+
+# Hash of the last record set bulk_update_dns_for_services applied successfully,
+# with the time it was written. It only stands in for the zone fetch for
+# DNS_STATE_MAX_AGE, so out-of-band zone edits get repaired by a later run;
+# delete the file to force the zone to be fetched and checked right away.
+DNS_STATE_FILE = PROJECT_ROOT / '.cache' / 'dns-state'
+DNS_STATE_MAX_AGE = 24 * 60 * 60
+
+# Shared session so DNS proxy calls reuse a keep-alive connection instead of a
+# new TCP+TLS handshake per request
+_proxy_session = requests.Session()
+_proxy_session.mount('https://', HTTPAdapter(pool_connections=2, pool_maxsize=8))
+atexit.register(_proxy_session.close)
+
+# getHosts and setHosts (a full replace) are both safe to repeat, so proxy calls are
+# retried on connection errors and gateway errors; every attempt, including retries,
+# waits for its own rate-limit slot (_post_to_dns_proxy)
+DNS_PROXY_MAX_RETRIES = 3
+DNS_PROXY_RETRY_STATUSES = frozenset({502, 503, 504})
+
+_namecheap_rate_lock = threading.Lock()
+_namecheap_next_call = 0.0
+
+def _wait_for_namecheap_slot():
+    """Block until the next Namecheap API call may be sent without tripping the rate limit."""
+    global _namecheap_next_call
+    with _namecheap_rate_lock:
+        now = time.monotonic()
+        delay = _namecheap_next_call - now
+        if delay > 0:
+            time.sleep(delay)
+            now = time.monotonic()
+        _namecheap_next_call = now + NAMECHEAP_MIN_SPACING + random.uniform(0, NAMECHEAP_SPACING_JITTER)
+
+def _post_to_dns_proxy(url: str, payload: Dict[str, Any]) -> requests.Response:
+    """POST a command to the DNS proxy, retrying gateway and connection errors within the Namecheap rate limit."""
+    for attempt in range(DNS_PROXY_MAX_RETRIES + 1):
+        _wait_for_namecheap_slot()
+        try:
+            response = _proxy_session.post(url, json=payload, timeout=30)
+        except requests.ConnectionError:
+            if attempt == DNS_PROXY_MAX_RETRIES:
+                raise
+            continue
+        if response.status_code not in DNS_PROXY_RETRY_STATUSES or attempt == DNS_PROXY_MAX_RETRIES:
+            return response
+        response.close()
+
+# DNS proxy configuration read by the first successful get_dns_proxy_config() call
+_dns_proxy_config: Optional[Tuple[str, str, str, str, str]] = None
+
 def get_dns_proxy_config() -> Tuple[str, str, str, str, str]:
-    """Get DNS proxy configuration from environment variables."""
+    """Get DNS proxy configuration from environment variables, reading and validating them once per process."""
+    global _dns_proxy_config
+    if _dns_proxy_config is None:
+        _dns_proxy_config = _read_dns_proxy_config()
+    return _dns_proxy_config
+
+def _read_dns_proxy_config() -> Tuple[str, str, str, str, str]:
+    """Read and validate DNS proxy configuration from environment variables."""
     proxy_url = os.getenv('DNS_PROXY_URL', 'https://shmuel-tech-dns-proxy.fly.dev')
     proxy_auth = os.getenv('DNS_PROXY_AUTH_TOKEN')
     api_user = os.getenv('NAMECHEAP_API_USER')
@@ -56,7 +122,7 @@ def get_namecheap_dns_records(domain: str, silent: bool = False) -> List[Dict[st
     }
     
     try:
-        response = requests.post(f"{proxy_url}/api/dns", json=payload, timeout=30)
+        response = _post_to_dns_proxy(f"{proxy_url}/api/dns", payload)
         response.raise_for_status()
         
         result = response.json()
@@ -75,6 +141,16 @@ def get_namecheap_dns_records(domain: str, silent: bool = False) -> List[Dict[st
             print(f"❌ Failed to fetch DNS records: {e}")
         raise
 
+def normalize_cname_target(address: str) -> str:
+    """Validate and normalize a CNAME target: no protocol prefix, fully qualified (trailing dot)."""
+    # Remove any protocol prefixes that shouldn't be in CNAME records
+    if address.startswith(('http://', 'https://')):
+        address = address.split('://', 1)[1]
+    # Ensure CNAME records are fully qualified (end with dot)
+    if not address.endswith('.'):
+        address += '.'
+    return address
+
 def update_namecheap_dns_records(domain: str, records: List[Dict[str, str]], silent: bool = False) -> bool:
     """Update DNS records in Namecheap via proxy."""
     if not silent:
@@ -89,21 +165,16 @@ def update_namecheap_dns_records(domain: str, records: List[Dict[str, str]], sil
     
     # Add each record as parameters in the format expected by proxy
     for i, record in enumerate(records, 1):
-        # Validate and normalize CNAME records
+        record_type = record['Type']
         address = record['Address']
-        if record['Type'] == 'CNAME':
-            # Remove any protocol prefixes that shouldn't be in CNAME records
-            if address.startswith(('http://', 'https://')):
-                address = address.split('://', 1)[1]
-            # Ensure CNAME records are fully qualified (end with dot)
-            if not address.endswith('.'):
-                address = address + '.'
+        if record_type == 'CNAME':
+            address = normalize_cname_target(address)
         
         data[f'HostName{i}'] = record['Name']
-        data[f'RecordType{i}'] = record['Type']
+        data[f'RecordType{i}'] = record_type
         data[f'Address{i}'] = address
         data[f'TTL{i}'] = record['TTL']
-        if record['Type'] == 'MX':
+        if record_type == 'MX':
             data[f'MXPref{i}'] = record['MXPref']
     
     payload = {
@@ -117,7 +188,7 @@ def update_namecheap_dns_records(domain: str, records: List[Dict[str, str]], sil
     }
     
     try:
-        response = requests.post(f"{proxy_url}/api/dns", json=payload, timeout=30)
+        response = _post_to_dns_proxy(f"{proxy_url}/api/dns", payload)
         response.raise_for_status()
         
         result = response.json()
@@ -144,12 +215,24 @@ def get_fly_app_cname(app_name: str, silent: bool = False) -> Optional[str]:
     return f"{app_name}.fly.dev."
 
 
+def get_fly_app_cnames(app_names: List[str]) -> Dict[str, Optional[str]]:
+    """
+    Get the CNAME targets for several Fly.io apps at once (app name -> target).
+    If the lookup ever needs flyctl, this is the place to make one batched call.
+    """
+    return {app_name: get_fly_app_cname(app_name, silent=True) for app_name in app_names}
+
+
 def normalize_dns_address(address: str) -> str:
     """Normalize DNS address for comparison by ensuring trailing dot and lowercase."""
     if not address.endswith('.'):
         address = address + '.'
     return address.lower()
 
+def _freeze_record(record: Dict[str, str]) -> Tuple[str, str, str, str, str]:
+    """Encode a DNS record as a hashable tuple so whole zones can be diffed as sets."""
+    return (record['Name'], record['Type'], record['Address'], record.get('TTL', ''), record.get('MXPref', '10'))
+
 def prepare_dns_changes_for_services(service_configs: List[Dict[str, str]], silent: bool = False) -> Tuple[List[Dict[str, str]], bool]:
     """
     Prepare DNS changes for multiple services in bulk.
@@ -176,28 +259,65 @@ def prepare_dns_changes_for_services(service_configs: List[Dict[str, str]], sile
         for i, record in enumerate(current_records):
             print(f"  {i}: Name='{record['Name']}', Type='{record['Type']}', Address='{record['Address']}'")
     
-    # Create a copy to work with
-    updated_records = current_records.copy()
+    # Snapshot the zone as hashable tuples, then update the fetched records in place;
+    # they are only used to build the new record set
+    records_before = frozenset(map(_freeze_record, current_records))
+    updated_records = current_records
     
-    # Process each service
-    changes_made = False
-    for config in service_configs:
-        service_name = config['service_name']
-        app_name = config['app_name']
+    # Index CNAME records by name so each service is an O(1) lookup instead of a
+    # scan of the whole zone (the first record wins, as with the previous scan)
+    cname_index = {}
+    for record in updated_records:
+        if record['Type'] == 'CNAME':
+            cname_index.setdefault(record['Name'], record)
+    
+    def upsert(name: str, cname_target: str, target_address: str) -> None:
+        """Point the CNAME record `name` at cname_target, adding it if missing."""
+        record = cname_index.get(name)
+        if record:
+            # Normalize the current address for comparison
+            if normalize_dns_address(record['Address']) == target_address:
+                if not silent:
+                    print(f"✅ Record for '{name}' already correct")
+                return
+            if not silent:
+                print(f"🔄 Updating DNS: {name} -> {cname_target}")
+            record['Address'] = cname_target
+            return
         
+        if not silent:
+            print(f"➕ Adding DNS: {name} -> {cname_target}")
+        new_record = {
+            'Name': name,
+            'Type': 'CNAME',
+            'Address': cname_target,
+            'TTL': '1800',
+            'MXPref': '10'
+        }
+        updated_records.append(new_record)
+        cname_index[name] = new_record
+    
+    # Resolve every service's hostnames and CNAME target before touching the records
+    # (main-site lives on the root domain and its www subdomain)
+    cname_targets = get_fly_app_cnames([config['app_name'] for config in service_configs])
+    targets = []
+    for config in service_configs:
+        service_name, app_name = config['service_name'], config['app_name']
+        cname_target = cname_targets.get(app_name)
+        targets.append((
+            service_name,
+            app_name,
+            "@" if service_name == "main-site" else service_name,
+            "www" if service_name == "main-site" else f"www.{service_name}",
+            cname_target,
+            normalize_dns_address(cname_target) if cname_target else None,
+        ))
+    
+    # Process each service
+    for service_name, app_name, hostname, www_hostname, cname_target, target_address in targets:
         if not silent:
             print(f"🔍 Processing service: {service_name} (app: {app_name})")
         
-        # Determine the hostname
-        if service_name == "main-site":
-            hostname = "@"  # Root domain
-            www_hostname = "www"  # www subdomain
-        else:
-            hostname = service_name
-            www_hostname = f"www.{service_name}"
-        
-        # Get the CNAME target from Fly
-        cname_target = get_fly_app_cname(app_name, silent=True)
         if not cname_target:
             if not silent:
                 print(f"⚠️  Could not determine CNAME target for app '{app_name}', skipping...")
@@ -206,76 +326,17 @@ def prepare_dns_changes_for_services(service_configs: List[Dict[str, str]], sile
         if not silent:
             print(f"🔍 Looking for hostname='{hostname}', www_hostname='{www_hostname}', target='{cname_target}'")
         
-        # Update or add the main record for this service
-        record_updated = False
-        for record in updated_records:
-            if record['Name'] == hostname and record['Type'] == 'CNAME':
-                # Normalize both addresses for comparison
-                current_address = normalize_dns_address(record['Address'])
-                target_address = normalize_dns_address(cname_target)
-                
-                if current_address != target_address:
-                    if not silent:
-                        print(f"🔄 Updating DNS: {hostname} -> {cname_target}")
-                    record['Address'] = cname_target
-                    changes_made = True
-                else:
-                    if not silent:
-                        print(f"✅ Record for '{hostname}' already correct")
-                record_updated = True
-                break
-        
-        # If main record doesn't exist, add it
-        if not record_updated:
-            if not silent:
-                print(f"➕ Adding DNS: {hostname} -> {cname_target}")
-            new_record = {
-                'Name': hostname,
-                'Type': 'CNAME',
-                'Address': cname_target,
-                'TTL': '1800',
-                'MXPref': '10'
-            }
-            updated_records.append(new_record)
-            changes_made = True
-        
-        # Update or add the www record for this service
-        www_record_updated = False
-        for record in updated_records:
-            if record['Name'] == www_hostname and record['Type'] == 'CNAME':
-                # Normalize both addresses for comparison
-                current_address = normalize_dns_address(record['Address'])
-                target_address = normalize_dns_address(cname_target)
-                
-                if current_address != target_address:
-                    if not silent:
-                        print(f"🔄 Updating DNS: {www_hostname} -> {cname_target}")
-                    record['Address'] = cname_target
-                    changes_made = True
-                else:
-                    if not silent:
-                        print(f"✅ Record for '{www_hostname}' already correct")
-                www_record_updated = True
-                break
         
-        # If www record doesn't exist, add it
-        if not www_record_updated:
-            if not silent:
-                print(f"➕ Adding DNS: {www_hostname} -> {cname_target}")
-            new_www_record = {
-                'Name': www_hostname,
-                'Type': 'CNAME',
-                'Address': cname_target,
-                'TTL': '1800',
-                'MXPref': '10'
-            }
-            updated_records.append(new_www_record)
-            changes_made = True
+        # Update or add the main and www records for this service
+        upsert(hostname, cname_target, target_address)
+        upsert(www_hostname, cname_target, target_address)
     
+    # Diff the whole zone in one set comparison
+    changes_made = frozenset(map(_freeze_record, updated_records)) != records_before
     if not changes_made:
         if not silent:
             print("✅ No DNS changes needed")
-        return current_records, False
+        return updated_records, False
     
     if not silent:
         print(f"✅ Prepared DNS changes for bulk update")
@@ -323,10 +384,41 @@ def verify_dns_changes_propagated(service_configs: List[Dict[str, str]], timeout
     return False, f"DNS changes did not propagate within {timeout} seconds"
 
 
+def _desired_dns_state_hash(service_configs: List[Dict[str, str]]) -> str:
+    """Hash the desired (service, app, CNAME target) set so repeat runs can be detected."""
+    cname_targets = get_fly_app_cnames([config['app_name'] for config in service_configs])
+    desired = sorted(
+        (config['service_name'], config['app_name'], cname_targets.get(config['app_name']) or '')
+        for config in service_configs
+    )
+    return hashlib.blake2b(repr((NAMECHEAP_DOMAIN, desired)).encode(), digest_size=8).hexdigest()
+
+def _read_dns_state() -> Optional[str]:
+    """Return the hash stored by the last successful bulk update, unless it is missing, malformed or expired."""
+    try:
+        state_hash, written_at = DNS_STATE_FILE.read_text(encoding='utf-8').split()
+        if time.time() - float(written_at) < DNS_STATE_MAX_AGE:
+            return state_hash
+    except (OSError, ValueError):
+        pass
+    return None
+
+def _write_dns_state(state_hash: str) -> None:
+    """Remember the hash of a record set that is now live, and when (best effort)."""
+    try:
+        DNS_STATE_FILE.parent.mkdir(parents=True, exist_ok=True)
+        DNS_STATE_FILE.write_text(f"{state_hash} {int(time.time())}\n", encoding='utf-8')
+    except OSError:
+        pass
+
+
 def bulk_update_dns_for_services(service_configs: List[Dict[str, str]], silent: bool = False) -> Tuple[bool, Optional[str]]:
     """
     Update DNS records for multiple services in a single bulk request.
     
+    If the same set of services was applied successfully within DNS_STATE_MAX_AGE
+    (see DNS_STATE_FILE), nothing is fetched from Namecheap and the call returns immediately.
+    
     Args:
         service_configs: List of dicts with 'service_name' and 'app_name' keys
         silent: Whether to suppress output
@@ -338,6 +430,13 @@ def bulk_update_dns_for_services(service_configs: List[Dict[str, str]], silent:
         if not silent:
             print(f"🌐 Starting bulk DNS update for {len(service_configs)} services...")
         
+        # Skip the zone fetch entirely when this exact record set is already live
+        state_hash = _desired_dns_state_hash(service_configs)
+        if _read_dns_state() == state_hash:
+            if not silent:
+                print("✅ Bulk DNS update completed - records unchanged since last successful update")
+            return True, None
+        
         # Prepare all DNS changes
         updated_records, changes_made = prepare_dns_changes_for_services(service_configs, silent=silent)
         
@@ -345,6 +444,7 @@ def bulk_update_dns_for_services(service_configs: List[Dict[str, str]], silent:
         if not changes_made:
             if not silent:
                 print("✅ Bulk DNS update completed - no changes needed")
+            _write_dns_state(state_hash)
             return True, None
         
         # Perform single bulk update
@@ -358,6 +458,7 @@ def bulk_update_dns_for_services(service_configs: List[Dict[str, str]], silent:
         if not success:
             return False, f"DNS update succeeded but propagation failed: {error_msg}"
         
+        _write_dns_state(state_hash)
         return True, None
         
     except Exception as e:
@@ -365,34 +466,3 @@ def bulk_update_dns_for_services(service_configs: List[Dict[str, str]], silent:
         if not silent:
             print(f"❌ {error_msg}")
         return False, error_msg
-
-def wait_for_certificate(app_name: str, domain: str, timeout: int = 300, silent: bool = False) -> bool:
-    """Wait for Fly.io certificate to be issued and verified."""
-    if not silent:
-        print(f"⏳ Waiting for certificate for '{domain}' in app '{app_name}'...")
-    
-    from .utils import run_command
-    
-    start_time = time.time()
-    
-    while time.time() - start_time < timeout:
-        result = run_command(['flyctl', 'certs', 'show', domain, '--app', app_name], check=False, silent=True)
-        
-        if result.returncode == 0:
-            # Parse the certificate status
-            output = result.stdout.lower()
-            if 'verified' in output and 'issued' in output:
-                if not silent:
-                    print(f"✅ Certificate ready for '{domain}'")
-                return True
-        
-        if not silent:
-            print(f"⏳ Certificate not ready yet, waiting... ({int(time.time() - start_time)}s)")
-        
-        time.sleep(10)
-    
-    if not silent:
-        print(f"⚠️  Certificate for '{domain}' not ready after {timeout}s")
-    return False
-
- 
\ No newline at end of file
@@ -5,129 +5,208 @@ Syncs environment variables from .env files to Fly.io secrets.
 """
 
 import argparse
+import hashlib
+import json
 import os
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, List, Optional, Set, Tuple
 
 # Import shared utilities
-from .utils import load_project_env, check_fly_auth, run_command
+from .utils import PROJECT_ROOT, load_project_env, check_fly_auth, run_command, list_service_names
 
-# Load environment variables
-load_project_env()
+# Maximum number of services whose secrets are synced at the same time
+MAX_PARALLEL_SYNCS = 16
 
+# Rule printed between services and around the summary
+SEPARATOR = '=' * 60
 
-def parse_env_file(env_file: Path) -> Dict[str, str]:
-    """Parse .env file and return dictionary of key-value pairs."""
-    if not env_file.exists():
-        raise FileNotFoundError(f".env file not found: {env_file}")
+# Per-service file recording a SHA-256 of each secret last pushed to Fly.io (never the values),
+# so unchanged secrets aren't set again: every secrets update restarts the app
+SECRETS_STATE_FILE = '.secrets.hash.json'
+
+
+def _emit(output: Optional[List[str]], message: str) -> None:
+    """Print a message, or collect it in output when a service's output is being buffered."""
+    if output is None:
+        print(message)
+    else:
+        output.append(message)
+
+
+# env file -> ((mtime in ns, size), parsed secrets), so an unchanged .env is only parsed once
+_env_file_cache: Dict[Path, Tuple[Tuple[int, int], Dict[str, str]]] = {}
+
+
+def parse_env_file(env_file: Path, output: Optional[List[str]] = None) -> Dict[str, str]:
+    """Parse .env file and return dictionary of key-value pairs (warnings go to output, see _emit)."""
+    try:
+        st = env_file.stat()
+    except FileNotFoundError:
+        raise FileNotFoundError(f".env file not found: {env_file}") from None
     
-    secrets = {}
+    # Empty placeholder .env files have nothing to parse, so don't open them
+    if st.st_size == 0:
+        return {}
     
-    with open(env_file, 'r') as f:
-        for line_num, line in enumerate(f, 1):
-            line = line.strip()
-            
-            # Skip empty lines and comments
-            if not line or line.startswith('#'):
-                continue
-            
-            # Parse key=value pairs
-            if '=' in line:
-                key, value = line.split('=', 1)
-                key = key.strip()
-                value = value.strip()
-                
-                # Remove quotes if present
-                if value.startswith('"') and value.endswith('"'):
-                    value = value[1:-1]
-                elif value.startswith("'") and value.endswith("'"):
-                    value = value[1:-1]
-                
-                if key:
-                    secrets[key] = value
-            else:
-                print(f"⚠️  Warning: Skipping invalid line {line_num} in {env_file}: {line}")
+    signature = (st.st_mtime_ns, st.st_size)
+    cached = _env_file_cache.get(env_file)
+    if cached and cached[0] == signature:
+        # Hand out a copy so callers can't modify the cached result
+        return dict(cached[1])
     
-    return secrets
+    # python-dotenv (already used for the project .env) handles `export` prefixes,
+    # quoting, escapes in double quotes, multi-line quoted values and inline comments.
+    # Interpolation is off so values containing '$' are synced verbatim.
+    from dotenv import dotenv_values
+    
+    secrets = {}
+    for key, value in dotenv_values(env_file, interpolate=False, encoding='utf-8').items():
+        if value is None:
+            _emit(output, f"⚠️  Warning: Skipping '{key}' in {env_file}: no value")
+            continue
+        secrets[key] = value
+    
+    _env_file_cache[env_file] = (signature, secrets)
+    return dict(secrets)
+
+
+def _hash_secret(key: str, value: str) -> str:
+    """Hash a secret for the local state file."""
+    return hashlib.sha256(f'{key}={value}'.encode('utf-8')).hexdigest()
+
 
+def _load_secret_hashes(state_file: Path) -> Dict[str, str]:
+    """Load the secret hashes recorded by the last successful sync ({} if none)."""
+    try:
+        return json.loads(state_file.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return {}
+
+
+def _format_import_line(key: str, value: str) -> str:
+    """Format one secret for `flyctl secrets import`; multi-line values go in triple quotes."""
+    if '\n' in value:
+        return f'{key}="""{value}"""\n'
+    return f'{key}={value}\n'
+
+
+def fly_list_secret_keys(app_name: str) -> Optional[Set[str]]:
+    """Get the names of the secrets currently set on a Fly.io app (None if they can't be listed)."""
+    result = run_command(['flyctl', 'secrets', 'list', '--json', '--app', app_name], check=False, silent=True)
+    if result.returncode != 0:
+        return None
+    try:
+        return {row.get('Name') or row.get('name') for row in json.loads(result.stdout)}
+    except (ValueError, TypeError, AttributeError):
+        return None
 
-def sync_secrets_to_fly(app_name: str, secrets: Dict[str, str], dry_run: bool = False) -> bool:
-    """Sync secrets to Fly.io app using fly secrets set command."""
+
+def sync_secrets_to_fly(app_name: str, secrets: Dict[str, str], dry_run: bool = False,
+                        state_file: Optional[Path] = None, output: Optional[List[str]] = None) -> bool:
+    """
+    Sync secrets to Fly.io app using the fly secrets import command.
+    
+    With a state_file, only secrets that are missing on the app or whose value changed
+    since the last successful sync are set; if there are none, flyctl isn't run at all.
+    
+    Messages are printed as they happen, with flyctl's output streamed to the terminal;
+    with an output list they are collected there instead, flyctl's output included.
+    """
     if not secrets:
-        print("ℹ️  No secrets to sync")
+        _emit(output, "ℹ️  No secrets to sync")
         return True
     
-    print(f"🔐 Syncing {len(secrets)} secrets to Fly.io app: {app_name}")
+    _emit(output, f"🔐 Syncing {len(secrets)} secrets to Fly.io app: {app_name}")
     
-    # Build the fly secrets set command
-    cmd = ['flyctl', 'secrets', 'set', '--app', app_name]
+    hashes = {key: _hash_secret(key, value) for key, value in secrets.items()}
+    if state_file and not dry_run:
+        current_keys = fly_list_secret_keys(app_name)
+        if current_keys is not None:
+            known_hashes = _load_secret_hashes(state_file)
+            secrets = {key: value for key, value in secrets.items()
+                       if key not in current_keys or known_hashes.get(key) != hashes[key]}
+            if not secrets:
+                _emit(output, "✅ Secrets already up to date, nothing to set")
+                return True
     
-    # Add each secret as key=value
-    for key, value in secrets.items():
-        # Escape special characters in values
-        cmd.append(f'{key}={value}')
+    # Pass the secrets to `flyctl secrets import` on stdin as KEY=VALUE lines: the
+    # argv stays small however many there are, and values never show up in process
+    # listings or in the logged command
+    cmd = ['flyctl', 'secrets', 'import', '--app', app_name]
+    secrets_input = ''.join(_format_import_line(key, value) for key, value in secrets.items())
     
     if dry_run:
-        print(f"🧪 Dry run - would execute: {' '.join(cmd[:4])} [REDACTED SECRETS]")
-        print(f"🔑 Secrets to set: {', '.join(secrets.keys())}")
+        _emit(output, f"🧪 Dry run - would execute: {' '.join(cmd)} < [{len(secrets)} REDACTED SECRETS]")
+        _emit(output, f"🔑 Secrets to set: {', '.join(secrets.keys())}")
         return True
     
-    print(f"🔑 Setting secrets: {', '.join(secrets.keys())}")
+    _emit(output, f"🔑 Setting secrets: {', '.join(secrets.keys())}")
     
-    try:
-        result = run_command(cmd, check=True, silent=False)
-        print("✅ Secrets synced successfully")
-        return True
-    except Exception as e:
-        print(f"❌ Failed to sync secrets: {e}")
+    if output is None:
+        result = run_command(cmd, check=False, silent=False, input_data=secrets_input)
+    else:
+        # Capture flyctl's output so it stays inside this service's buffered block
+        output.append(f"🔧 Running: {' '.join(cmd)}")
+        result = run_command(cmd, check=False, silent=True, input_data=secrets_input)
+        output.extend(text.strip() for text in (result.stdout, result.stderr) if text and text.strip())
+    if result.returncode != 0:
+        _emit(output, f"❌ Failed to sync secrets: flyctl exited with code {result.returncode}")
         return False
+    _emit(output, "✅ Secrets synced successfully")
+    
+    if state_file:
+        try:
+            state_file.write_text(json.dumps(hashes, indent=2, sort_keys=True) + '\n', encoding='utf-8')
+        except OSError as e:
+            _emit(output, f"⚠️  Warning: Could not record synced secrets in {state_file}: {e}")
+    return True
 
 
 def get_services(services_dir: Path) -> List[str]:
     """Get list of service names."""
-    services = []
-    
-    for service_dir in services_dir.iterdir():
-        if service_dir.is_dir() and not service_dir.name.startswith('.'):
-            services.append(service_dir.name)
-    
-    return sorted(services)
+    # One os.scandir pass (no stat() per entry), cached until the directory changes
+    return sorted(list_service_names(services_dir))
 
 
-def sync_service_secrets(service_name: str, services_dir: Path, dry_run: bool = False) -> bool:
-    """Sync secrets for a specific service."""
+def sync_service_secrets(service_name: str, services_dir: Path, dry_run: bool = False,
+                         output: Optional[List[str]] = None) -> bool:
+    """Sync secrets for a specific service (messages go to output, see sync_secrets_to_fly)."""
     service_dir = services_dir / service_name
     env_file = service_dir / '.env'
     app_name = f"shmuel-tech-{service_name}"
     
-    if not service_dir.exists():
-        print(f"❌ Service '{service_name}' not found in {services_dir}")
-        return False
-    
-    if not env_file.exists():
-        print(f"⚠️  No .env file found for service '{service_name}' at {env_file}")
-        return True  # Not an error, just no secrets to sync
-    
-    print(f"📋 Processing service: {service_name}")
-    print(f"📄 Reading secrets from: {env_file}")
+    _emit(output, f"📋 Processing service: {service_name}")
     
     try:
-        secrets = parse_env_file(env_file)
+        # parse_env_file stats the file anyway, so only look further when it's missing
+        try:
+            secrets = parse_env_file(env_file, output)
+        except FileNotFoundError:
+            if not service_dir.is_dir():
+                _emit(output, f"❌ Service '{service_name}' not found in {services_dir}")
+                return False
+            _emit(output, f"⚠️  No .env file found for service '{service_name}' at {env_file}")
+            return True  # Not an error, just no secrets to sync
+        
+        _emit(output, f"📄 Read secrets from: {env_file}")
         
         if not secrets:
-            print(f"ℹ️  No secrets found in {env_file}")
+            _emit(output, f"ℹ️  No secrets found in {env_file}")
             return True
         
-        return sync_secrets_to_fly(app_name, secrets, dry_run)
+        return sync_secrets_to_fly(app_name, secrets, dry_run, state_file=service_dir / SECRETS_STATE_FILE,
+                                   output=output)
         
     except Exception as e:
-        print(f"❌ Error processing secrets for '{service_name}': {e}")
+        _emit(output, f"❌ Error processing secrets for '{service_name}': {e}")
         return False
 
 
-def sync_all_services(services_dir: Path, dry_run: bool = False) -> bool:
-    """Sync secrets for all services."""
+def sync_all_services(services_dir: Path, dry_run: bool = False, max_parallel: Optional[int] = None) -> bool:
+    """Sync secrets for all services, at most max_parallel at once (default: MAX_PARALLEL_SYNCS)."""
     print("🔄 Syncing secrets for all services...")
     
     services = get_services(services_dir)
@@ -141,27 +220,51 @@ def sync_all_services(services_dir: Path, dry_run: bool = False) -> bool:
     success_count = 0
     error_count = 0
     
-    for service_name in services:
-        print(f"\n{'='*60}")
-        success = sync_service_secrets(service_name, services_dir, dry_run)
-        
-        if success:
-            success_count += 1
-        else:
-            error_count += 1
+    # flyctl calls are network-bound, so sync the services concurrently; each
+    # service's output is collected in its own list and printed as one block when it finishes
+    output_lock = threading.Lock()
     
-    # Print summary
-    print(f"\n{'='*60}")
-    print(f"📊 Secret Sync Summary")
-    print(f"{'='*60}")
-    print(f"✅ Successfully synced: {success_count}/{len(services)} services")
+    def sync_one(service_name: str) -> bool:
+        output = []
+        try:
+            return sync_service_secrets(service_name, services_dir, dry_run, output=output)
+        finally:
+            block = "".join(f"{line}\n" for line in output)
+            with output_lock:
+                sys.stdout.write(f"\n{SEPARATOR}\n{block}")
+                sys.stdout.flush()
     
+    if max_parallel is None:
+        max_parallel = MAX_PARALLEL_SYNCS
+    with ThreadPoolExecutor(max_workers=max(1, min(len(services), max_parallel))) as executor:
+        futures = {executor.submit(sync_one, service_name): service_name for service_name in services}
+        for future in as_completed(futures):
+            try:
+                success = future.result()
+            except Exception as e:
+                with output_lock:
+                    print(f"❌ Error processing secrets for '{futures[future]}': {e}")
+                success = False
+            
+            if success:
+                success_count += 1
+            else:
+                error_count += 1
+    
+    # Print summary in a single write
+    summary = (
+        f"\n{SEPARATOR}\n"
+        f"📊 Secret Sync Summary\n"
+        f"{SEPARATOR}\n"
+        f"✅ Successfully synced: {success_count}/{len(services)} services\n"
+    )
     if error_count > 0:
-        print(f"❌ Failed to sync: {error_count}/{len(services)} services")
-        return False
+        summary += f"❌ Failed to sync: {error_count}/{len(services)} services\n"
     else:
-        print("🎉 All services synced successfully!")
-        return True
+        summary += "🎉 All services synced successfully!\n"
+    sys.stdout.write(summary)
+    
+    return error_count == 0
 
 
 def main():
@@ -170,16 +273,21 @@ def main():
     parser.add_argument('--service', '-s', help='Sync secrets for specific service')
     parser.add_argument('--services-dir', default='services', help='Services directory (default: services)')
     parser.add_argument('--dry-run', '-n', action='store_true', help='Show what would be done without actually doing it')
+    parser.add_argument('--max-parallel', '-j', type=int, default=None,
+                        help=f'Maximum number of services synced at once (default: {MAX_PARALLEL_SYNCS})')
     
     args = parser.parse_args()
     
+    # Load environment variables (e.g. FLY_API_TOKEN) only once we know we'll need them
+    load_project_env()
+    
     # Check Fly.io authentication
     if not check_fly_auth():
         print("❌ Not authenticated with Fly.io. Run 'fly auth login' first.")
         sys.exit(1)
     
     # Get project root directory
-    project_root = Path(__file__).parent.parent
+    project_root = PROJECT_ROOT
     services_dir = project_root / args.services_dir
     
     if not services_dir.exists():
@@ -196,7 +304,7 @@ def main():
         if args.service:
             success = sync_service_secrets(args.service, services_dir, args.dry_run)
         else:
-            success = sync_all_services(services_dir, args.dry_run)
+            success = sync_all_services(services_dir, args.dry_run, args.max_parallel)
         
         sys.exit(0 if success else 1)
         
@@ -8,16 +8,32 @@ import os
 import subprocess
 import sys
 from pathlib import Path
-from typing import List
+from typing import Dict, FrozenSet, List, Optional, Tuple
 
-# Load environment variables from .env file if it exists
-from dotenv import load_dotenv
+# Repository root (the directory containing scripts/)
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+# Fly.io certificate status polling: start at 2s, grow by 1.5x per poll, cap at 15s
+CERT_POLL_INITIAL_INTERVAL = 2.0
+CERT_POLL_MAX_INTERVAL = 15.0
+CERT_POLL_BACKOFF = 1.5
+
+# Whether load_project_env() has already run in this process
+_project_env_loaded = False
 
 
 def load_project_env() -> None:
-    """Load environment variables from .env file in project root."""
+    """Load environment variables from .env file in project root (once per process)."""
+    global _project_env_loaded
+    if _project_env_loaded:
+        return
+    _project_env_loaded = True
+    
+    # Imported here so scripts that never need the .env don't pay for importing dotenv
+    from dotenv import load_dotenv
+    
     # Load from root directory (../.env relative to this script)
-    dotenv_path = Path(__file__).parent.parent / '.env'
+    dotenv_path = PROJECT_ROOT / '.env'
     try:
         load_dotenv(dotenv_path, override=False)
     except Exception:
@@ -27,53 +43,105 @@ def load_project_env() -> None:
 
 
 def run_command(cmd: List[str], check: bool = True, silent: bool = False, input_data: str = None) -> subprocess.CompletedProcess:
-    """Run a command and return the result."""
+    """Run a command and return the result.
+    
+    Non-silent commands write straight to the terminal as they run (result.stdout and
+    result.stderr are None); silent commands are captured.
+    
+    A failing command exits the process when check is True; with check=False the
+    CompletedProcess is always returned and the caller inspects returncode.
+    """
     if not silent:
         print(f"🔧 Running: {' '.join(cmd)}")
-    
-    try:
-        result = subprocess.run(
-            cmd, 
-            check=check, 
-            capture_output=True, 
-            text=True,
-            input=input_data
-        )
-        if result.stdout and not silent:
-            print(result.stdout.strip())
-        return result
-    except subprocess.CalledProcessError as e:
+        # The child writes to the same terminal/pipe; keep our output ahead of its
+        sys.stdout.flush()
+
+    result = subprocess.run(
+        cmd,
+        stdout=subprocess.PIPE if silent else None,
+        stderr=subprocess.PIPE if silent else None,
+        text=True,
+        input=input_data
+    )
+
+    if result.returncode != 0:
         if not silent:
-            print(f"❌ Command failed: {e}")
-            if e.stderr:
-                print(f"Error: {e.stderr.strip()}")
+            print(f"❌ Command failed: returncode {result.returncode}")
         if check:
             sys.exit(1)
-        return e
+    
+    return result
+
+
+# Result of the first check_fly_auth() call in this process
+_fly_authenticated: Optional[bool] = None
 
 
 def check_fly_auth() -> bool:
-    """Check if user is authenticated with Fly.io."""
+    """Check if user is authenticated with Fly.io. The result is cached for the rest of the process."""
+    global _fly_authenticated
+    if _fly_authenticated is None:
+        _fly_authenticated = _check_fly_auth()
+    return _fly_authenticated
+
+
+def _check_fly_auth() -> bool:
+    """Check Fly.io authentication: FLY_API_TOKEN if set, otherwise the flyctl login session."""
     print("🔐 Checking Fly.io authentication...")
-    result = run_command(['flyctl', 'auth', 'whoami'], check=False, silent=True)
     
+    # flyctl reads FLY_API_TOKEN from the environment itself, so no subprocess is needed
+    if os.environ.get('FLY_API_TOKEN'):
+        print("✅ Using FLY_API_TOKEN for Fly.io authentication")
+        return True
+    
+    result = run_command(['flyctl', 'auth', 'whoami'], check=False, silent=True)
     if result.returncode == 0:
         print("✅ Already authenticated with Fly.io")
         return True
-        
-    # Check if FLY_API_TOKEN exists
-    token = os.environ.get('FLY_API_TOKEN')
-    if not token:
-        print("❌ Not authenticated with Fly.io and FLY_API_TOKEN environment variable not found")
-        return False
-        
-    # Try to authenticate with token
-    print("🔑 Attempting to authenticate using FLY_API_TOKEN...")
-    auth_result = run_command(['flyctl', 'auth', 'token'], check=False, silent=True, input_data=token)
     
-    if auth_result.returncode != 0:
-        print(f"❌ Failed to authenticate with FLY_API_TOKEN: {auth_result.stderr.strip()}")
-        return False
+    print("❌ Not authenticated with Fly.io and FLY_API_TOKEN environment variable not found")
+    return False
+
+
+# Fly.io API token resolved by the first get_fly_api_token() call ('' when unavailable)
+_fly_api_token: Optional[str] = None
+
+
+def get_fly_api_token() -> Optional[str]:
+    """Get the Fly.io API token from FLY_API_TOKEN or `flyctl auth token`, resolving it once per process."""
+    global _fly_api_token
+    if _fly_api_token is None:
+        token = os.environ.get('FLY_API_TOKEN', '')
+        if not token:
+            result = run_command(['flyctl', 'auth', 'token'], check=False, silent=True)
+            token = result.stdout.strip() if result.returncode == 0 and result.stdout else ''
+        _fly_api_token = token
+    return _fly_api_token or None
+
+
+# services_dir -> (directory mtime in ns, service names) from the last scan
+_service_names_cache: Dict[Path, Tuple[int, FrozenSet[str]]] = {}
+
+
+def list_service_names(services_dir: Path) -> FrozenSet[str]:
+    """
+    Get the names of the service directories in services_dir (empty if it doesn't exist).
+    The listing is cached until the directory's mtime changes, i.e. until a service
+    is added, removed or renamed, so repeated calls cost a single stat().
+    """
+    try:
+        mtime = services_dir.stat().st_mtime_ns
+    except FileNotFoundError:
+        return frozenset()
+    
+    cached = _service_names_cache.get(services_dir)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    
+    # os.scandir reuses the file type from the directory listing, avoiding a stat() per entry
+    with os.scandir(services_dir) as entries:
+        names = frozenset(entry.name for entry in entries
+                          if not entry.name.startswith('.') and entry.is_dir())
     
-    print("✅ Successfully authenticated with Fly.io using API token")
-    return True 
\ No newline at end of file
+    _service_names_cache[services_dir] = (mtime, names)
+    return names